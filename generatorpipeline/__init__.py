@@ -6,20 +6,33 @@ The generatorpipeline package provides a clean and easy interface to build
 a data processing pipeline using python generators and the multiprocessing library.
 '''
 
-from .generatorpipeline import pipeline
-from .helper import isiterator
+from .generatorpipeline import pipeline, broadcast, fuse, set_worker_budget
+from .helper import isiterator, isasynciterator
+from .multistage import run_stages
 from .streamfunctions import simplecache, observe, observe_time
-from . import accumulators  # noqa
+from . import backends  # noqa
 
 
-__all__ = ['pipeline']
-__all__ += ['isiterator']
+__all__ = ['pipeline', 'broadcast', 'fuse', 'run_stages', 'set_worker_budget']
+__all__ += ['isiterator', 'isasynciterator']
 __all__ += ['simplecache', 'observe', 'observe_time', 'savestream', 'loadstream']
 
-from ._version import get_versions  # noqa
-__version__ = get_versions()['version']
-__git_version__ = get_versions()['full-revisionid']
-# work around if zip is downloaded from github and current version does not have a tag.
-if __version__ == '0+unknown':
-    __version__ = __git_version__
-del get_versions
+
+def __getattr__(name):
+    # `accumulators` (numpy) and the version (which may run git) are loaded on first
+    # access. Thus the workers of `backend='interpreter'` can import this package within
+    # subinterpreters, which support neither numpy nor subprocesses.
+    if name == 'accumulators':
+        import importlib
+        return importlib.import_module('.accumulators', __name__)
+    if name in ('__version__', '__git_version__'):
+        from ._version import get_versions
+        versions = get_versions()
+        globals()['__git_version__'] = versions['full-revisionid']
+        # work around if zip is downloaded from github and current version does not have a tag.
+        if versions['version'] == '0+unknown':
+            globals()['__version__'] = versions['full-revisionid']
+        else:
+            globals()['__version__'] = versions['version']
+        return globals()[name]
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -30,6 +30,11 @@ import random
 import time
 import heapq
 
+try:
+    from scipy.linalg.blas import dsyrk as _dsyrk
+except ImportError:
+    _dsyrk = None
+
 
 class Accumulator(abc.ABC):
     '''
@@ -72,6 +77,58 @@ class Accumulator(abc.ABC):
 
     __iadd__ = accumulate
 
+    def accumulate_batch(self, array, axis=0):
+        '''
+        Accumulates all observations stacked along `axis` of `array`. This is equivalent to
+        accumulating them one after another, but subclasses may do it in a single
+        vectorized step.
+        '''
+        for obj in np.moveaxis(np.asanyarray(array), axis, 0):
+            self._accumulate_obj(obj)
+        return self
+
+
+# smaller arrays are accumulated out-of-place, which has less overhead.
+_INPLACE_MINSIZE = 4096
+
+
+def _inplace(obj):
+    '''
+    Whether `obj` is an array, which is large enough to be accumulated in-place.
+    '''
+    return isinstance(obj, np.ndarray) and obj.size >= _INPLACE_MINSIZE
+
+
+def _state(val, obj):
+    '''
+    The accumulator state `val` as an array of the shape of the array `obj` and at least
+    float64, such that `obj` can be accumulated in-place. `val` is reused if possible.
+    Returns None if the shapes differ.
+    '''
+    dtype = np.result_type(obj, val, np.float64)
+    if np.ndim(val) == 0:
+        return np.full(obj.shape, val, dtype=dtype)
+    if not isinstance(val, np.ndarray) or val.shape != obj.shape:
+        return None
+    return val if val.dtype == dtype else val.astype(dtype)
+
+
+def _scratch(buf, shape, dtype):
+    '''
+    A buffer of the given `shape` and `dtype`. `buf` is reused if possible.
+    '''
+    if buf is None or buf.shape != shape or buf.dtype != dtype:
+        return np.empty(shape, dtype=dtype)
+    return buf
+
+
+def _batch(array, axis):
+    '''
+    `array` with the observations along the first axis and their number.
+    '''
+    array = np.moveaxis(np.asanyarray(array), axis, 0)
+    return array, len(array)
+
 
 class Counter(Accumulator):
     '''
@@ -148,7 +205,13 @@ class Maximum(_BinaryOpAccumulatorNumpy):
 class Mean(Accumulator):
     '''
     Calculate the Mean over all data.
+
+    Arrays of at least 4096 elements are accumulated in-place into a float64 state, so no
+    temporary arrays are allocated once the first array has been accumulated. For arrays,
+    `value` is the state and changes with every accumulated array. Use
+    `np.copy(acc.value)` to keep a snapshot.
     '''
+    _scratch = None
 
     def __init__(self, value=0, n=0):
         if not n >= 0:
@@ -158,13 +221,27 @@ class Mean(Accumulator):
 
     def _accumulate_obj(self, obj):
         self._n += 1
-        self._val += obj / self._n - self._val / self._n
+        val = _state(self._val, obj) if _inplace(obj) else None
+        if val is None:
+            self._val += obj / self._n - self._val / self._n
+            return
+        self._val = val
+        self._scratch = _scratch(self._scratch, val.shape, val.dtype)
+        np.subtract(obj, val, out=self._scratch)
+        self._scratch /= self._n
+        val += self._scratch
 
     def _accumulate_other(self, other):
         ntot = self.n + other.n
         self._val = self._val * (self.n / ntot) + other._val * (other.n / ntot)
         self._n += other._n
 
+    def accumulate_batch(self, array, axis=0):
+        array, k = _batch(array, axis)
+        if k > 0:
+            self._accumulate_other(Mean(np.mean(array, axis=0), k))
+        return self
+
     @property
     def value(self):
         return self._val
@@ -184,7 +261,10 @@ class RunningMean(Accumulator):
 
     Note: `_accumulate_other` is not implemented as the order of
     elements matters.
+
+    Arrays are accumulated in-place, see `Mean`. However, `value` returns a copy of the state.
     '''
+    _scratch = None
 
     def __init__(self, lifetime=10):
         self.acc = 0
@@ -194,10 +274,23 @@ class RunningMean(Accumulator):
     def _accumulate_obj(self, obj):
         self._n += 1
         alpha = max(self.alpha, 1 / self._n)
-        self.acc = self.acc * (1 - alpha) + obj * alpha
+        acc = _state(self.acc, obj) if _inplace(obj) else None
+        if acc is None:
+            self.acc = self.acc * (1 - alpha) + obj * alpha
+            return
+        self.acc = acc
+        self._scratch = _scratch(self._scratch, acc.shape, acc.dtype)
+        np.subtract(obj, acc, out=self._scratch)
+        self._scratch *= alpha
+        acc += self._scratch
 
     @property
     def value(self):
+        return np.copy(self.acc) if isinstance(self.acc, np.ndarray) else self.acc
+
+    @property
+    def _val(self):
+        # the state itself, as used by `Variance`
         return self.acc
 
     @property
@@ -219,17 +312,32 @@ class Variance(Accumulator):
 
     Internally Welfords Algorithm is used:
     https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Welford's_online_algorithm
+
+    Arrays are accumulated in-place, see `Mean`.
     '''
+    _delta1 = None
+    _delta2 = None
 
     def __init__(self):
         self.mean = Mean()
         self.var = Mean()
 
     def _accumulate_obj(self, obj):
-        delta1 = obj - self.mean.value
+        if not _inplace(obj) or np.shape(self.mean._val) not in ((), obj.shape):
+            delta1 = obj - self.mean._val
+            self.mean += obj
+            # (obj - M_n-1) * (obj - M_n) -- last and current iteration mean
+            self.var += delta1 * (obj - self.mean._val)
+            return
+        # same as above using preallocated buffers
+        dtype = np.result_type(obj, np.float64)
+        self._delta1 = delta1 = _scratch(self._delta1, obj.shape, dtype)
+        self._delta2 = delta2 = _scratch(self._delta2, obj.shape, dtype)
+        np.subtract(obj, self.mean._val, out=delta1)
         self.mean += obj
-        # (obj - M_n-1) * (obj - M_n) -- last and current iteration mean
-        self.var += delta1 * (obj - self.mean.value)
+        np.subtract(obj, self.mean._val, out=delta2)
+        delta2 *= delta1
+        self.var += delta2
 
     def _accumulate_other(self, other):
         # for explanation of the formulas, see
@@ -240,6 +348,19 @@ class Variance(Accumulator):
         self.mean += other.mean
         self.var = Mean(value=newvar / newn, n=newn)
 
+    def accumulate_batch(self, array, axis=0):
+        # the observations are combined into a Variance of the block, which is then
+        # merged using the parallel algorithm as in `_accumulate_other`.
+        array, k = _batch(array, axis)
+        if k == 0:
+            return self
+        other = Variance()
+        mean = np.mean(array, axis=0)
+        other.mean = Mean(mean, k)
+        other.var = Mean(np.mean((array - mean) ** 2, axis=0), k)
+        self._accumulate_other(other)
+        return self
+
     @property
     def n(self):
         return self.mean.n
@@ -269,6 +390,9 @@ class RunningVariance(Variance):
         self.mean = RunningMean(lifetime=lifetime)
         self.var = RunningMean(lifetime=lifetime)
 
+    # the order of elements matters
+    accumulate_batch = Accumulator.accumulate_batch
+
     @property
     def lifetime(self):
         return self.mean.lifetime
@@ -279,58 +403,164 @@ class RunningVariance(Variance):
         self.var.lifetime = x
 
 
+def _syrk(a, alpha, beta, c, scratch):
+    '''
+    `c = alpha * a.T @ a + beta * c`, mostly in-place. Only the upper triangle of
+    the returned matrix is valid. `scratch` is used without BLAS.
+    '''
+    if _dsyrk is not None and c.flags.f_contiguous:
+        # `a.T` is Fortran ordered, so no copies are made.
+        return _dsyrk(alpha, a.T, beta=beta, c=c, trans=0, lower=0, overwrite_c=1)
+    np.matmul(a.T, a, out=scratch)
+    c *= beta
+    scratch *= alpha
+    c += scratch
+    return c
+
+
 class Covariance(Accumulator):
     '''
     Calculate the Covariance (matrix).
 
     Returns the same as `numpy.cov`.
+
+    The observations are buffered and merged into a preallocated matrix in blocks of
+    `blocksize` using a single matrix product per block. If scipy is available,
+    the BLAS function `syrk` is used, which only updates the upper triangle.
     '''
+    _nblock = 0  # number of buffered observations
 
-    def __init__(self):
+    def __init__(self, blocksize=32):
+        if not (isinstance(blocksize, int) and blocksize >= 1):
+            raise ValueError(f'blocksize must be a positive integer, not {blocksize}.')
+        self.blocksize = blocksize
         self.mean = Mean()
-        self._cov = Mean()
+        self._rms = None  # upper triangle of the sum of (obj - mean)(obj - mean).T / n
+        self._block = None
+        self._scratch = None
 
-    def _accumulate_obj(self, obj):
-        delta1 = obj - self.mean.value
-        self.mean += obj
-        delta2 = (obj - self.mean.value)
-        D = np.outer(delta1, delta2)
-        self._cov += D
+    @property
+    def mean(self):
+        self._flush()
+        return self._mean
 
-    def _accumulate_other(self, other):
+    @mean.setter
+    def mean(self, mean):
+        self._mean = mean
+
+    def _allocate(self, d):
+        self._rms = np.zeros((d, d), order='F')
+        if _dsyrk is None:
+            self._scratch = np.empty((d, d))
+
+    def _accumulate_obj(self, obj):
+        obj = np.ravel(obj)
+        if self._block is None:
+            # one additional row for `_update`
+            self._block = np.empty((self.blocksize + 1, len(obj)))
+        self._block[self._nblock] = obj
+        self._nblock += 1
+        if self._nblock == self.blocksize:
+            self._flush()
+
+    def _flush(self):
+        if self._nblock > 0:
+            k, self._nblock = self._nblock, 0
+            self._update(self._block, k)
+
+    def _update(self, block, k):
+        '''
+        Merges the observations `block[:k]` into the state. `block` is overwritten
+        and must have `k + 1` rows.
+        '''
         # for explanation of the formulas, see
         # https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Parallel_algorithm
-        dmean = self.mean.value - other.mean.value
-        newn = self.n + other.n
-        newvar = self._cov.sum + other._cov.sum + np.outer(dmean, dmean) * self.n * other.n / newn
-        self.mean += other.mean
-        self._cov = Mean(value=newvar / newn, n=newn)
+        n = self._mean.n
+        newn = n + k
+        rows = block[:k]
+        mean = np.mean(rows, axis=0)
+        rows -= mean
+        if self._rms is None:
+            self._allocate(block.shape[1])
+        if n > 0:
+            # the outer product of the difference of the means is added as an extra row.
+            block[k] = (self._mean.value - mean) * np.sqrt(n * k / newn)
+            rows = block[:k + 1]
+        self._rms = _syrk(rows, 1 / newn, n / newn, self._rms, self._scratch)
+        self._mean += Mean(mean, k)
+
+    def _accumulate_other(self, other):
+        self._flush()
+        other._flush()
+        if other.n == 0:
+            return
+        if self.n == 0:
+            self._mean = Mean(np.copy(other._mean.value), other.n)
+            self._allocate(len(other._rms))
+            self._rms[...] = other._rms
+            return
+        dmean = self._mean.value - other._mean.value
+        n, m = self.n, other.n
+        newn = n + m
+        self._rms *= n / newn
+        self._rms += other._rms * (m / newn)
+        self._rms += np.outer(dmean, dmean) * (n * m / newn ** 2)
+        self._mean += other._mean
+
+    def accumulate_batch(self, array, axis=0):
+        array, k = _batch(array, axis)
+        if k == 0:
+            return self
+        self._flush()
+        block = np.empty((k + 1, array[0].size))
+        block[:k] = array.reshape(k, -1)
+        self._update(block, k)
+        return self
 
     @property
     def n(self):
-        return self.mean.n
+        return self._mean.n + self._nblock
 
     @property
     def value(self):
-        return self._cov.value * (self.n / (self.n - 1))
+        return self.rms * (self.n / (self.n - 1))
 
     @property
     def rms(self):
-        return self._cov.value
+        self._flush()
+        return np.triu(self._rms) + np.triu(self._rms, 1).T
 
 
 class RunningCovariance(Covariance):
     '''
     Calculate the exponential running Covariance(matrix).
 
-    Note: `accumulate_other` will raise a NotImplementedError
-    inside RunningMean.
+    Note: `accumulate_other` is not implemented as the order of
+    elements matters.
     '''
 
     def __init__(self, lifetime=10):
         self.mean = RunningMean(lifetime=lifetime)
         self._cov = RunningMean(lifetime=lifetime)
 
+    _accumulate_other = Accumulator._accumulate_other
+    accumulate_batch = Accumulator.accumulate_batch
+
+    def _accumulate_obj(self, obj):
+        delta1 = obj - self.mean.value
+        self.mean += obj
+        delta2 = (obj - self.mean.value)
+        D = np.outer(delta1, delta2)
+        self._cov += D
+
+    @property
+    def n(self):
+        return self.mean.n
+
+    @property
+    def rms(self):
+        return self._cov.value
+
     @property
     def lifetime(self):
         return self.mean.lifetime
@@ -519,6 +749,11 @@ class CDFEstimator(Accumulator):
       * points - number of positions for CDF sampling
         OR
         list of sampling positions
+      * pos_dtype=float - dtype of the marker positions. The positions are integers, so
+        `np.int32` or `np.uint32` halve the memory of the positions for large arrays
+        (up to 2**31 - 1 or 2**32 - 1 observations).
+      * height_dtype=float - dtype of the marker heights, e.g. `np.float32`.
+        The calculations are always done in float64.
 
     This implementation follows the P^2 algorithm
     proposed by Jain and Chlamtac in the paper
@@ -560,7 +795,9 @@ class CDFEstimator(Accumulator):
     Robert Radloff 2022
     '''
 
-    def __init__(self, points):
+    def __init__(self, points, pos_dtype=float, height_dtype=float):
+        self.pos_dtype = np.dtype(pos_dtype)
+        self.height_dtype = np.dtype(height_dtype)
         if np.asanyarray(points).shape == ():
             # linear spacing (equiprobable cells)
             self.q_desired = np.asarray(np.linspace(0, 1, points))
@@ -590,16 +827,17 @@ class CDFEstimator(Accumulator):
     def _init_m_pos(self, shape):
         if self.m_pos is not None:
             raise ValueError(f'`{self}.m_pos` was already initialized.')
-        self.m_pos = np.ones((len(self.q_desired), *shape), dtype=float)  # marker positions
-        a = np.arange(len(self.q_desired), dtype=float)
+        # marker positions
+        self.m_pos = np.empty((len(self.q_desired), *shape), dtype=self.pos_dtype)
+        a = np.arange(len(self.q_desired), dtype=self.pos_dtype)
         a.shape = (len(self.q_desired), *[1 for _ in range(len(shape))])
-        self.m_pos *= a
+        self.m_pos[...] = a
 
     def _init_m_height(self, shape):
         if self.m_height is not None:
             raise ValueError(f'`{self}.m_height` was already initialized.')
         # marker heights
-        self.m_height = np.ones((len(self.q_desired), *shape), dtype=float) * np.nan
+        self.m_height = np.full((len(self.q_desired), *shape), np.nan, dtype=self.height_dtype)
 
     def _accumulate_obj(self, obj):
         obj = np.asarray(obj)
@@ -615,22 +853,42 @@ class CDFEstimator(Accumulator):
         elif self._n == len(self.q_desired) - 1:
             self.m_height[self._n] = obj
             self.m_height = np.sort(self.m_height, axis=0)
+            self._adjust_heights()
+            self._n += 1
         else:
-            # Check for new Min
-            cond_min = obj < self.m_height[0]
-            self.m_height[0] = np.where(cond_min, obj, self.m_height[0])
-            # Check for new Max
-            cond_max = obj > self.m_height[-1]
-            self.m_height[-1] = np.where(cond_max, obj, self.m_height[-1])
-            # Increment Marker positions
-            self.m_pos[1:] += (obj <= self.m_height[1:])
-
-            # assert self.m_pos[0] == 0 and self.m_pos[-1] == self.n
+            self._update(obj)
+
+    def _update(self, obj):
+        '''
+        Accumulates `obj` once all markers are initialized.
+        '''
+        # Check for new Min and Max
+        np.copyto(self.m_height[0, ...], obj, where=obj < self.m_height[0])
+        np.copyto(self.m_height[-1, ...], obj, where=obj > self.m_height[-1])
+        # Increment Marker positions
+        self.m_pos[1:] += (obj <= self.m_height[1:])
+        # assert self.m_pos[0] == 0 and self.m_pos[-1] == self.n
         self._adjust_heights()
         # assert np.all(self.m_height[:-1] <= self.m_height[1:]),
         # f'Problem: Heights unsorted at {self.n}'
         self._n += 1
 
+    def accumulate_batch(self, array, axis=0):
+        '''
+        Accumulates all observations stacked along `axis` of `array`.
+
+        The P^2 algorithm updates the markers after every observation, so the
+        observations are still processed one after another, but with less overhead
+        per observation than `accumulate`.
+        '''
+        array = np.moveaxis(np.asanyarray(array), axis, 0)
+        ninit = max(0, min(len(array), len(self.q_desired) - self._n))
+        for obj in array[:ninit]:
+            self._accumulate_obj(obj)
+        for obj in array[ninit:]:
+            self._update(obj)
+        return self
+
     def _m_posdiff(self, i):
         '''
         Calculate the difference between the marker positions
@@ -645,44 +903,46 @@ class CDFEstimator(Accumulator):
     def _adjust_heights(self):
         '''
         This function implements step B3 from box 1 in the Jain and Chlamtac paper.
-        '''
-
-        def adjust_possible(pdiff, positions):
-            l_step = np.logical_and(pdiff <= -1, positions[0] - positions[1] < -1)
-            r_step = np.logical_and(pdiff >= 1, positions[2] - positions[1] > 1)
-            return np.logical_or(l_step, r_step)
-
-        def parabolic_possible(h_new, heights):  # p for previous, n for next
-            # could potentially be replaced
-            # by a check if heights are still strictly increasing
-            return np.logical_and(heights[0] < h_new, h_new < heights[2])
 
+        The markers must be adjusted one after another, as the adjustment of a marker
+        depends on the already adjusted marker below. Markers which are close enough to
+        their desired positions are skipped and for each marker, only the elements which
+        need an adjustment are calculated.
+        '''
         # assert np.all(self._m_posdiff[..., 0]) == 0 and np.all(self._m_posdiff[..., -1] == 0)
+        desired = self._m_desired
+        # views with all elements along the second axis.
+        m_height = self.m_height.reshape(len(self.q_desired), -1)
+        m_pos = self.m_pos.reshape(len(self.q_desired), -1)
         for i in range(1, len(self.q_desired) - 1):
-            posdiff = self._m_posdiff(i)
-            direction = np.sign(posdiff)
-            heights = (self.m_height[i-1],
-                       self.m_height[i],
-                       self.m_height[i+1])
-            positions = (self.m_pos[i-1],
-                         self.m_pos[i],
-                         self.m_pos[i+1])
+            # Only markers at least one position away from the desired position can be
+            # adjusted. This check does not need temporary arrays.
+            if desired[i] - m_pos[i].max() > -1 and desired[i] - m_pos[i].min() < 1:
+                continue
+            posdiff = desired[i] - m_pos[i]
+            # the marker is moved by one position if that does not lead to a collision
+            # (positions are increasing, so the differences are safe for unsigned dtypes.)
+            adj = (((posdiff <= -1) & (m_pos[i] - m_pos[i-1] > 1))
+                   | ((posdiff >= 1) & (m_pos[i+1] - m_pos[i] > 1)))
+            idx = np.flatnonzero(adj)
+            if len(idx) == 0:
+                continue
+            if len(idx) == adj.size:
+                idx = slice(None)  # avoids copies
+            direction = np.sign(posdiff[idx])
+            heights = (m_height[i-1, idx], m_height[i, idx], m_height[i+1, idx])
+            positions = tuple(np.asarray(m_pos[j, idx], dtype=float) for j in (i-1, i, i+1))
             # calc parabolic and linear interp for all observations
             par = self._parabolic(heights, positions, direction)
             # depending on the step direction _linear requires different arguments.
-            lin = self._linear((heights[1], np.where(direction < 0, heights[0], heights[2])),
-                               (positions[1], np.where(direction < 0, positions[0], positions[2])),
+            left = direction < 0
+            lin = self._linear((heights[1], np.where(left, heights[0], heights[2])),
+                               (positions[1], np.where(left, positions[0], positions[2])),
                                direction)
-            pos = self.m_pos[i] + direction
-            # Apply height changes where needed.
-            adj = adjust_possible(posdiff, positions)
-            self.m_height[i] = np.where(adj,
-                                        np.where(parabolic_possible(par, heights), par, lin),
-                                        self.m_height[i])
-            # Don't forget to adjust marker positions where necessary
-            self.m_pos[i] = np.where(adj,
-                                     pos,
-                                     self.m_pos[i])
+            # use the parabolic interpolation if heights are still strictly increasing.
+            m_height[i, idx] = np.where((heights[0] < par) & (par < heights[2]), par, lin)
+            # Don't forget to adjust marker positions
+            m_pos[i, idx] = positions[1] + direction
 
     @staticmethod
     def _linear(q, n, d):
@@ -796,10 +1056,11 @@ class CDFEstimator(Accumulator):
 
 class QuantileEstimator(CDFEstimator):
 
-    def __init__(self, p):
+    def __init__(self, p, pos_dtype=float, height_dtype=float):
         self.p = p
         # desired quantile markers
-        super().__init__(np.asarray([0, 0.5 * p, p, 0.5 * (p + 1), 1], dtype=float))
+        super().__init__(np.asarray([0, 0.5 * p, p, 0.5 * (p + 1), 1], dtype=float),
+                         pos_dtype=pos_dtype, height_dtype=height_dtype)
 
     @property
     def value(self):
@@ -811,8 +1072,8 @@ class MedianEstimator(QuantileEstimator):
     Calculate the approximate median.
     Uses QuantileEstimator with p=0.5.
     '''
-    def __init__(self):
-        super().__init__(0.5)
+    def __init__(self, pos_dtype=float, height_dtype=float):
+        super().__init__(0.5, pos_dtype=pos_dtype, height_dtype=height_dtype)
 
 
 class BinSorter(Accumulator):
@@ -0,0 +1,412 @@
+# Copyright (C) 2026 Stephan Kuschel
+#
+# This file is part of generatorpipeline.
+#
+# generatorpipeline is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# generatorpipeline is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with generatorpipeline. If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+Execution backends of parallel pipelines.
+
+A backend executes single tasks (`submit`). The pipeline decides which tasks are
+submitted when, so a backend does not need to know about the order of elements,
+chunking or caching. Any `concurrent.futures.Executor` can be used via `ExecutorBackend`.
+'''
+
+import concurrent.futures
+import itertools
+import os
+import pickle
+import threading
+import time
+from collections import deque
+from multiprocessing import Pool, resource_tracker
+from multiprocessing.pool import ThreadPool
+
+
+__all__ = ['Backend', 'ProcessBackend', 'ThreadBackend', 'SerialBackend', 'ExecutorBackend',
+           'InterpreterBackend', 'RingBackend', 'interpreters_available']
+
+
+def interpreters_available():
+    '''
+    Whether `InterpreterBackend` can be used (python 3.14+).
+    '''
+    return hasattr(concurrent.futures, 'InterpreterPoolExecutor')
+
+
+class Backend():
+    '''
+    Base class of all backends. Subclasses implement `_submit` and `shutdown`.
+
+    If `pickles` is True, the tasks are executed in other processes (or interpreters). Then the
+    pipeline is sent to the workers only once using the `registry` and
+    `transport='sharedmem'` can be used. Otherwise the tasks are executed within
+    the current process and elements are not copied.
+    '''
+    pickles = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = dict(submitted=0, completed=0, failed=0)
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def submit(self, fn, args=(), kwargs=None, callback=None, error_callback=None):
+        '''
+        Schedules `fn(*args, **kwargs)` and returns an object, whose `get()` method returns
+        the result or raises the exception. Once finished, either `callback(result)` or
+        `error_callback(exception)` is called, possibly from another thread.
+        '''
+        def done(ret):
+            self._count('completed')
+            if callback is not None:
+                callback(ret)
+
+        def failed(exc):
+            self._count('failed')
+            if error_callback is not None:
+                error_callback(exc)
+        self._count('submitted')
+        return self._submit(fn, tuple(args), kwargs or {}, done, failed)
+
+    def _submit(self, fn, args, kwargs, callback, error_callback):
+        raise NotImplementedError
+
+    def map_window(self, fn, iterable, window=1):
+        '''
+        Yields `fn(el)` for all elements of `iterable` in order, keeping up to `window`
+        tasks in flight. Pipelines use their own scheduling on top of `submit` instead.
+        '''
+        inflight = deque()
+        for el in iterable:
+            inflight.append(self.submit(fn, (el,)))
+            if len(inflight) >= window:
+                yield inflight.popleft().get()
+        while inflight:
+            yield inflight.popleft().get()
+
+    def shutdown(self, wait=True):
+        '''
+        Releases the workers. Pending tasks are finished if `wait`, otherwise they are
+        cancelled.
+        '''
+        pass
+
+    def stats(self):
+        '''
+        Numbers of tasks submitted, completed and failed so far.
+        '''
+        with self._lock:
+            return dict(self._stats)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown(wait=False)
+
+
+class _PoolBackend(Backend):
+
+    def _submit(self, fn, args, kwargs, callback, error_callback):
+        return self._pool.apply_async(fn, args, kwargs, callback=callback,
+                                      error_callback=error_callback)
+
+    def shutdown(self, wait=True):
+        if wait:
+            self._pool.close()
+            self._pool.join()
+        else:
+            self._pool.terminate()
+
+
+class ProcessBackend(_PoolBackend):
+    '''
+    A `multiprocessing.Pool` of `nworkers` processes.
+    '''
+
+    def __init__(self, nworkers, maxtasksperchild=None):
+        super().__init__()
+        # Start the resource tracker before the workers, such that they inherit it.
+        # Then shared memory blocks attached or created by the workers and unlinked by the
+        # main process are tracked consistently and cleaned up if the program crashes.
+        resource_tracker.ensure_running()
+        self._pool = Pool(nworkers, maxtasksperchild=maxtasksperchild)
+
+
+class ThreadBackend(_PoolBackend):
+    '''
+    A pool of `nworkers` threads within the current process.
+    '''
+    pickles = False
+
+    def __init__(self, nworkers):
+        super().__init__()
+        self._pool = ThreadPool(nworkers)
+
+
+class _Result():
+
+    def __init__(self, value=None, exc=None):
+        self.value = value
+        self.exc = exc
+
+    def get(self):
+        if self.exc is not None:
+            raise self.exc
+        return self.value
+
+
+class SerialBackend(Backend):
+    '''
+    Executes each task immediately within `submit`. Useful for debugging and to measure
+    the overhead of the parallel execution path.
+    '''
+    pickles = False
+
+    def _submit(self, fn, args, kwargs, callback, error_callback):
+        try:
+            ret = _Result(fn(*args, **kwargs))
+        except Exception as e:
+            error_callback(e)
+            return _Result(exc=e)
+        callback(ret.value)
+        return ret
+
+
+class _FutureResult():
+
+    def __init__(self, future):
+        self.future = future
+
+    def get(self):
+        return self.future.result()
+
+
+class ExecutorBackend(Backend):
+    '''
+    Wraps a `concurrent.futures.Executor` (e.g. `ProcessPoolExecutor`, loky or
+    `InterpreterPoolExecutor`). By default, all executors except `ThreadPoolExecutor`
+    are assumed to execute the tasks in other processes, see `Backend.pickles`.
+    '''
+
+    def __init__(self, executor, pickles=None):
+        super().__init__()
+        self.executor = executor
+        if pickles is None:
+            # `InterpreterPoolExecutor` is derived from `ThreadPoolExecutor`.
+            pickles = (not isinstance(executor, concurrent.futures.ThreadPoolExecutor)
+                       or type(executor).__name__ == 'InterpreterPoolExecutor')
+        self.pickles = pickles
+        if pickles:
+            # see `ProcessBackend`
+            resource_tracker.ensure_running()
+
+    def _submit(self, fn, args, kwargs, callback, error_callback):
+        def done(future):
+            if future.cancelled():
+                error_callback(concurrent.futures.CancelledError())
+            elif future.exception() is not None:
+                error_callback(future.exception())
+            else:
+                callback(future.result())
+        future = self.executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(done)
+        return _FutureResult(future)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+class InterpreterBackend(ExecutorBackend):
+    '''
+    A pool of `nworkers` subinterpreters within the current process, each with its own GIL
+    (`concurrent.futures.InterpreterPoolExecutor`, python 3.14+). Starting a subinterpreter
+    is faster than starting a process and pure python functions run in parallel.
+    The data is still pickled. Only extension modules supporting subinterpreters
+    can be used by the function, which excludes numpy so far.
+    '''
+
+    def __init__(self, nworkers):
+        if not interpreters_available():
+            raise RuntimeError('InterpreterPoolExecutor requires python 3.14 or later.')
+        super().__init__(concurrent.futures.InterpreterPoolExecutor(nworkers), pickles=True)
+
+
+class _RingResult():
+
+    def __init__(self, callback, error_callback):
+        self.callback = callback
+        self.error_callback = error_callback
+        self._event = threading.Event()
+        self._value = None
+        self._exc = None
+
+    def _set(self, success, value):
+        if success:
+            self._value = value
+        else:
+            self._exc = value
+        self._event.set()
+        if success:
+            self.callback(value)
+        else:
+            self.error_callback(value)
+
+    def get(self):
+        self._event.wait()
+        if self._exc is not None:
+            raise self._exc
+        return self._value
+
+
+class RingBackend(Backend):
+    '''
+    `nworkers` processes, which receive their tasks and send their results through
+    shared memory ring buffers (`ringbuffer.Ring`) instead of pipes. A thread in the main
+    process collects the results. This reduces the round trip time of small messages.
+
+    Idle workers poll their ring for `spin` seconds before they sleep on a semaphore.
+    Spinning reduces the latency further but uses CPU time, so by default it is only
+    enabled if there are more CPUs than workers. Each ring holds `capacity` bytes, larger
+    messages are streamed through the ring.
+
+    The tasks of a worker, which died unexpectedly, fail with a `RuntimeError`. Following
+    tasks are sent to the remaining workers.
+    '''
+
+    def __init__(self, nworkers, capacity=2**20, spin=None):
+        super().__init__()
+        import multiprocessing
+        from . import ringbuffer
+        if spin is None:
+            spin = 50e-6 if (os.cpu_count() or 1) > nworkers else 0
+        resource_tracker.ensure_running()  # see `ProcessBackend`
+        self._respsem = multiprocessing.Semaphore(0)  # shared by all response rings
+        self._requests, self._responses, self._procs = [], [], []
+        for _ in range(nworkers):
+            req = ringbuffer.Ring(capacity, multiprocessing.Semaphore(0),
+                                  multiprocessing.Semaphore(0), spin=spin)
+            resp = ringbuffer.Ring(capacity, self._respsem,
+                                   multiprocessing.Semaphore(0), spin=spin)
+            p = multiprocessing.Process(target=ringbuffer.worker, args=(req, resp), daemon=True)
+            p.start()
+            self._requests.append(req)
+            self._responses.append(resp)
+            self._procs.append(p)
+        self.spin = spin
+        self._writelocks = [threading.Lock() for _ in range(nworkers)]
+        self._pending = dict()  # taskid -> (result, worker)
+        self._outstanding = [0] * nworkers
+        self._taskids = itertools.count()
+        self._stop = False
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _submit(self, fn, args, kwargs, callback, error_callback):
+        result = _RingResult(callback, error_callback)
+        with self._lock:
+            if self._stop:
+                raise ValueError('RingBackend has been shut down.')
+            taskid = next(self._taskids)
+        try:
+            data = pickle.dumps((taskid, fn, args, kwargs), protocol=5)
+        except Exception as exc:
+            result._set(False, exc)
+            return result
+        with self._lock:
+            # the living worker with the fewest tasks
+            alive = [w for w, p in enumerate(self._procs) if p.is_alive()]
+            if alive:
+                w = min(alive, key=self._outstanding.__getitem__)
+                self._outstanding[w] += 1
+                self._pending[taskid] = (result, w)
+        if not alive:
+            result._set(False, RuntimeError('all workers of the RingBackend have died.'))
+            return result
+        with self._writelocks[w]:
+            self._requests[w].write(data)
+        return result
+
+    def _finish(self, taskid, success, value):
+        with self._lock:
+            result, w = self._pending.pop(taskid)
+            self._outstanding[w] -= 1
+        result._set(success, value)
+
+    def _collect(self):
+        # runs in a separate thread and collects the results of all workers.
+        while not self._stop:
+            found = False
+            for resp in self._responses:
+                if resp.available() > 0:
+                    self._finish(*pickle.loads(resp.read()))
+                    found = True
+            if found:
+                continue
+            if self._wait():
+                continue
+            self._checkworkers()
+
+    def _wait(self):
+        # waits for a response. Returns False after a timeout. Does not spin, as that
+        # would hold the GIL of the main process.
+        def ready():
+            return any(resp.available() > 0 for resp in self._responses)
+        for resp in self._responses:
+            resp.setwaiting(True)
+        try:
+            if ready():
+                return True
+            return self._respsem.acquire(timeout=0.1)
+        finally:
+            for resp in self._responses:
+                resp.setwaiting(False)
+
+    def _checkworkers(self):
+        # fail the tasks of workers which died unexpectedly.
+        for w, p in enumerate(self._procs):
+            if self._stop or p.is_alive() or self._outstanding[w] == 0:
+                continue
+            with self._lock:
+                taskids = [t for t, (_, tw) in self._pending.items() if tw == w]
+            for taskid in taskids:
+                self._finish(taskid, False,
+                             RuntimeError(f'worker {p.pid} died with exit code {p.exitcode}.'))
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._stop:
+                return
+        if wait:
+            while self._pending:
+                time.sleep(1e-3)
+        with self._lock:
+            self._stop = True
+        if wait:
+            for req, lock in zip(self._requests, self._writelocks):
+                with lock:
+                    req.write(b'')
+            for p in self._procs:
+                p.join()
+        else:
+            for p in self._procs:
+                p.terminate()
+                p.join()
+        self._collector.join()
+        for ring in self._requests + self._responses:
+            ring.close(unlink=True)
@@ -17,14 +17,44 @@
 #
 
 import functools
-from multiprocessing import Pool
+import heapq
+import concurrent.futures
 import os
 import inspect
-from collections import deque
-from .helper import isiterator
+import pickle
+import statistics
+import asyncio
+import atexit
+import contextlib
+import itertools
+import queue
+import threading
+import time
+import weakref
+from .helper import isiterator, isasynciterator
+from .backends import (Backend, ProcessBackend, ThreadBackend, SerialBackend, ExecutorBackend,
+                       InterpreterBackend, RingBackend, interpreters_available)
 
 
-__all__ = ['pipeline']
+__all__ = ['pipeline', 'broadcast', 'fuse', 'set_worker_budget']
+
+# target runtime of a single chunk in seconds when using `chunksize='auto'`.
+# This is large compared to the inter-process communication overhead per chunk.
+_AUTOCHUNK_TIME = 10e-3
+_AUTOCHUNK_MAX = 4096
+
+# `nworkers='auto'`: number of elements timed in the current process and the estimated
+# communication overhead per task and per byte sent to or received from a worker.
+_AUTOPROBE = 8
+_TASKCOST = {'process': 125e-6, 'thread': 20e-6}
+_BYTECOST = {'process': 2e-9, 'thread': 0}
+
+
+def _cpucount():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
 
 
 class Pipeline():
@@ -33,7 +63,19 @@ class Pipeline():
                  skipNone=True,
                  extracache=0,
                  verbose=False,
-                 maxtasksperchild=None):
+                 maxtasksperchild=None,
+                 persistent=False,
+                 chunksize=1,
+                 ordered=True,
+                 reorderbuffer=None,
+                 backend='process',
+                 transport=None,
+                 initializer=None,
+                 initargs=(),
+                 autoscale=False,
+                 weight=1,
+                 priority=0,
+                 instrument=False):
         '''
         Create a pipeline decorator.
 
@@ -47,6 +89,15 @@ class Pipeline():
           per function call.
           If workers > 0, then the inter-process communication will
           create overhead of about 125 micro-seconds per function call.
+          Functions returning a generator (to insert elements into the stream) can
+          be executed in parallel as well. The generator is exhausted within the worker
+          and all its elements are sent back at once.
+          `'auto'` times the first few elements within the current process and compares
+          the runtime per element to the estimated communication overhead (including the
+          size of the elements and results). Then it either stays serial or starts
+          a pool with as many workers as are useful, but at most one per CPU.
+          The decision is made on the first call and kept for all following calls.
+          `pipe_info()` shows the decision and its reason.
 
         skipNone = True,
           when False, also `None` objects will be returned.
@@ -67,35 +118,273 @@ class Pipeline():
           getting blocked by another resource. This is also one of the first things to try
           when execution on a large dataset fails, that has worked on a small dataset.
           Try setting this to the number of elements in the small dataset.
+        persistent = False,
+          keep the `multiprocessing.Pool` alive after the iterator has been
+          exhausted and reuse it for every subsequent call. This saves the
+          process startup time, which dominates when the same pipeline is applied
+          to many short iterators. The pool is shut down by `close()` or
+          at interpreter exit.
+        chunksize = 1,
+          number of elements sent to a worker within a single task. The results
+          of all elements of a chunk are sent back in a single message as well.
+          This reduces the inter-process communication overhead per element
+          by about a factor of `chunksize`, which is useful for fast functions.
+          `'auto'` starts with single elements and adjusts the chunksize
+          to the measured runtime per element, such that a chunk takes about 10 ms.
+          Note that the cache holds `nworkers + extracache` many chunks.
+          The order of elements and the `skipNone` behavior is not affected.
+        ordered = True,
+          when False, results are returned in the order they are finished by the workers
+          instead of the order of the input elements. A single slow element will then
+          not stall all results behind it. The number of elements in flight is still
+          limited by the cache. Only affects parallel execution.
+        reorderbuffer = None,
+          number of finished results, which may be held back in ordered mode while
+          waiting for a slower element submitted before them. The workers stay busy with
+          new elements, such that only the consumer has to wait for the slow element.
+          Defaults to `nworkers + extracache`. `reorderbuffer=0` submits new
+          elements only after the oldest result has been returned.
+        backend = 'process',
+          `'process'` executes the function in `nworkers` many processes.
+          `'thread'` uses a pool of `nworkers` threads within the current process instead.
+          Elements and results are not pickled and not copied, so this is the better
+          choice for functions releasing the GIL (numpy, scipy, IO) or on free-threaded
+          python builds. The function must be thread-safe. `maxtasksperchild` is ignored.
+          `'interpreter'` runs `nworkers` subinterpreters with their own GIL within the
+          current process (see `backends.InterpreterBackend`). This starts faster than
+          processes and runs pure python functions in parallel. Falls back to
+          `'process'` on python versions without `InterpreterPoolExecutor` (before 3.14).
+          `'ring'` uses `nworkers` processes, which communicate through ring buffers in
+          shared memory instead of pipes (see `backends.RingBackend`). This reduces the
+          round trip time for small elements. `maxtasksperchild` is ignored.
+          `'serial'` executes the tasks one after another within the current thread, which
+          is useful for debugging.
+          Instead, a `backends.Backend` or any `concurrent.futures.Executor` can be given.
+          These are not shut down by the pipeline. `nworkers` still limits the number of
+          tasks in flight.
+        transport = None,
+          `'sharedmem'` sends large numpy arrays (also nested in tuples, lists and dicts)
+          to and from the workers via shared memory instead of pickling them. The workers
+          receive read-only views of the input arrays, which must not be kept beyond the
+          function call. Only applies to the `'process'` backend. Requires numpy.
+        initializer = None,
+          `initializer(*initargs)` is called once in every worker before it processes
+          its first element, e.g. to load a model or open a file. For serial execution
+          and the `'thread'` backend, it is called once in the current process.
+        initargs = (),
+          arguments given to `initializer`.
+        autoscale = False,
+          adapt the number of busy workers to the load at runtime. `nworkers + extracache`
+          becomes the maximum number of elements (or chunks) in flight. Starting with one,
+          another one is added whenever all of them are busy and the consumer has to wait
+          for them. One is removed whenever finished results had to wait, i.e. the workers
+          are starved by the upstream generator or the consumer.
+          The pool is started with all `nworkers` workers, as `multiprocessing.Pool`
+          can not be resized. Workers without a task sleep without using CPU time.
+        weight = 1,
+          number of slots of the worker budget (see `set_worker_budget`) occupied by each
+          task, e.g. for functions using multiple threads themselves.
+        priority = 0,
+          pipelines with a higher priority are served first, when multiple pipelines
+          are waiting for free slots of the worker budget.
+        instrument = False,
+          record the time spent in the function (wall and CPU time), waiting for the
+          upstream generator and for the consumer, the occupancy of the window of
+          elements in flight, the worker utilization and the bytes sent to and received
+          from the workers. See `snapshot()` and `pipe_info()`. When disabled, this costs
+          a single check per element or chunk. The bytes are measured by pickling the
+          elements and results an additional time, which is costly for large data.
+
+        Coroutine functions (`async def`) are supported as well. Applied to an iterator
+        or an async iterator, they return an async generator, which awaits up to
+        `nworkers + extracache` (but at least 1) coroutines concurrently within the current
+        event loop. `ordered`, `reorderbuffer` and `skipNone` work as for parallel
+        execution. `backend` and `chunksize` do not apply.
+
+        Keyword arguments given along with the iterator, `f(gen, y=3)`, are passed to
+        every call of the function. For parallel execution they are pickled and sent with
+        every task, so each call receives its own copy. Large constant arguments can be
+        sent to each worker only once by wrapping them with `broadcast`,
+        `f(gen, mask=gp.broadcast(mask))`. Then the workers receive read-only views of
+        numpy arrays in shared memory and keep the value for following calls.
+
+        Stateful stages can be written as a class. If the decorated callable has a
+        `setup` method, it is called once per worker (after `initializer`) and the
+        instance keeps its state for all following elements:
+
+            class Lookup():
+                def setup(self):
+                    self.table = expensive_setup()
+
+                def __call__(self, el):
+                    return self.table[el]
+
+            lookup = gp.pipeline(4)(Lookup())
         '''
         if not callable(func):
             raise TypeError("{} must be a callable".format(func))
+        if nworkers != 'auto' and not (isinstance(nworkers, int) and nworkers >= 0):
+            raise ValueError(f"nworkers must be a non-negative integer or 'auto', not {nworkers}.")
+        if chunksize != 'auto' and not (isinstance(chunksize, int) and chunksize >= 1):
+            raise ValueError(f"chunksize must be a positive integer or 'auto', not {chunksize}.")
+        if isinstance(backend, concurrent.futures.Executor):
+            backend = ExecutorBackend(backend)
+        if not isinstance(backend, Backend) and backend not in _BACKENDS:
+            raise ValueError(f"backend must be one of {_BACKENDS}, a Backend or "
+                             f"an Executor, not {backend}.")
+        if transport not in (None, 'sharedmem'):
+            raise ValueError(f"transport must be None or 'sharedmem', not {transport}.")
+        if not (isinstance(weight, int) and weight >= 1):
+            raise ValueError(f"weight must be a positive integer, not {weight}.")
+        self._wrap(func)
         self.func = func
-        self.nworkers = nworkers
-        self.cachelen = nworkers + extracache
+        self.isasync = inspect.iscoroutinefunction(func)
+        self.autoworkers = nworkers == 'auto'
+        self.autoreason = None
+        self.extracache = extracache
         self.verbose = verbose
         self.skipNone = skipNone
         self.maxtasksperchild = maxtasksperchild
-        functools.update_wrapper(self, func)
+        self.persistent = persistent
+        self._pool = None
+        self.chunksize = chunksize
+        self.ordered = ordered
+        self._reorderbuffer = reorderbuffer
+        # until the decision of `nworkers='auto'`, use one worker per CPU.
+        self._setnworkers(_cpucount() if self.autoworkers else nworkers)
+        self.backend = backend
+        self.transport = transport
+        self._resources = None
+        self.initializer = initializer
+        self.initargs = tuple(initargs)
+        self._initialized = False
+        self._initlock = threading.Lock()
+        self.autoscale = autoscale
+        self.weight = weight
+        self.priority = priority
+        self.instrument = instrument
+        self._instrumentation = _Instrumentation() if instrument else None
+        self._measurebytes = False  # only within workers
         # collect statistics
         self.el_processed = 0
         self.el_yielded = 0
 
     def __call__(self, arg, **kwargs):
         # No Docstring! It has been set in `__init__` by `functools.update_wrapper`
+        if self.isasync and (isiterator(arg) or isasynciterator(arg)):
+            return self._call_async(arg, **_unwrap(kwargs))
         if isiterator(arg):
+            if self.autoworkers and self.autoreason is None:
+                return self._call_auto(arg, **kwargs)
             if self.nworkers == 0:
-                return self._call_serial(arg, **kwargs)
+                return self._call_serial(arg, **_unwrap(kwargs))
             else:
                 return self._call_parallel(arg, **kwargs)
         else:
+            if not self._initialized:
+                self._initialize()
+            if self.verbose:
+                print(f'executing wrapped function "{self._funcname}" (PID: {os.getpid()}).')
+            return self.func(arg, **_unwrap(kwargs))
+
+    def _wrap(self, func):
+        # must be called before setting any attributes. The attributes of a class-based
+        # stage are not copied, as they would overwrite the settings of the pipeline.
+        functools.update_wrapper(self, func, updated=() if not inspect.isfunction(func)
+                                 else functools.WRAPPER_UPDATES)
+
+    @property
+    def _funcname(self):
+        return getattr(self.func, '__name__', type(self.func).__name__)
+
+    def _initialize(self):
+        '''
+        Calls the `initializer` and the `setup` method of the function once.
+        '''
+        with self._initlock:
+            if self._initialized:
+                return
             if self.verbose:
-                print(f'executing wrapped function "{self.func.__name__}" (PID: {os.getpid()}).')
-            return self.func(arg, **kwargs)
+                print(f'initializing "{self._funcname}" (PID: {os.getpid()}).')
+            if self.initializer is not None:
+                self.initializer(*self.initargs)
+            setup = getattr(self.func, 'setup', None)
+            if callable(setup):
+                setup()
+            self._initialized = True
+
+    def _setnworkers(self, nworkers):
+        self.nworkers = nworkers
+        self.cachelen = nworkers + self.extracache
+        self._scaler = _Autoscaler(self.cachelen)
+        if self._reorderbuffer is None:
+            self.reorderbuffer = self.cachelen
+        else:
+            self.reorderbuffer = self._reorderbuffer
+
+    def _call_auto(self, arg, **kwargs):
+        '''
+        Executes the first elements serially to measure their runtime and size,
+        then decides on `nworkers` and continues with the remaining elements.
+        '''
+        if not self._initialized:
+            self._initialize()
+        times, sizes = [], []
+        for el in itertools.islice(arg, _AUTOPROBE):
+            t0 = time.perf_counter()
+            ret = self(el, **kwargs)
+            if isiterator(ret):
+                ret = list(ret)
+            else:
+                ret = [ret]
+            times.append(time.perf_counter() - t0)
+            sizes.append(_picklesize(el) + _picklesize(ret))
+            self.el_processed += 1
+            for r in ret:
+                if r is not None or not self.skipNone:
+                    self.el_yielded += 1
+                    yield r
+        if len(times) == 0:
+            return
+        self._decide(statistics.median(times), statistics.mean(sizes))
+        yield from self(arg, **kwargs)
+
+    def _decide(self, runtime, size):
+        '''
+        Sets `nworkers` given the runtime and the size (elements and results in bytes)
+        per element.
+        '''
+        if self.chunksize == 'auto':
+            chunklen = _AUTOCHUNK_MAX if runtime <= 0 else _AUTOCHUNK_TIME / runtime
+            chunklen = min(_AUTOCHUNK_MAX, max(1, chunklen))
+        else:
+            chunklen = self.chunksize
+        kind = 'process' if self._pickles() else 'thread'
+        cost = _TASKCOST[kind] / chunklen + _BYTECOST[kind] * size
+        # The main process spends `cost` per element, so more workers than
+        # `runtime / cost` can not be kept busy.
+        ncpu = _cpucount()
+        nworkers = min(ncpu, int(runtime / cost))
+        info = (f'{runtime * 1e6:.1f} us per element, '
+                f'{cost * 1e6:.1f} us communication overhead per element')
+        if ncpu < 2:
+            self._setnworkers(0)
+            self.autoreason = f'serial: only a single CPU available ({info})'
+        elif nworkers < 2:
+            self._setnworkers(0)
+            self.autoreason = f'serial: parallel execution does not pay off ({info})'
+        else:
+            self._setnworkers(nworkers)
+            self.autoreason = f'{nworkers} {self._backendname()} workers ({info})'
+        if self.verbose:
+            print(f'nworkers=\'auto\' for "{self._funcname}": {self.autoreason}')
 
     def _call_serial(self, arg, **kwargs):
         if self.verbose:
-            print(f'serial execution of "{self.func.__name__}"')
+            print(f'serial execution of "{self._funcname}"')
+        if self._instrumentation is not None:
+            yield from self._call_serial_instrumented(arg, **kwargs)
+            return
         for el in arg:
             ret = self(el, **kwargs)  # f(el)
             self.el_processed += 1
@@ -106,43 +395,775 @@ class Pipeline():
                     self.el_yielded += 1
                     yield r
 
+    def _call_serial_instrumented(self, arg, **kwargs):
+        stats = self._instrumentation
+        clock, cpuclock = time.perf_counter, time.thread_time
+        start = t = clock()
+        try:
+            for el in arg:
+                t0, c0 = clock(), cpuclock()
+                stats.upstream += t0 - t
+                ret = self(el, **kwargs)  # f(el)
+                self.el_processed += 1
+                if not isiterator(ret):
+                    ret = (ret,)
+                for r in ret:
+                    if r is not None or not self.skipNone:
+                        t1 = clock()
+                        stats.walltime += t1 - t0
+                        stats.cputime += cpuclock() - c0
+                        self.el_yielded += 1
+                        yield r
+                        t0, c0 = clock(), cpuclock()
+                        stats.downstream += t0 - t1
+                t = clock()
+                stats.walltime += t - t0
+                stats.cputime += cpuclock() - c0
+                stats.elements += 1
+        finally:
+            elapsed = clock() - start
+            stats.elapsed += elapsed
+            stats.workertime += elapsed
+
+    def _call_chunk(self, chunk, **kwargs):
+        '''
+        Executes the function on all elements of `chunk` within the worker.
+        Returns the list of results of each element, the wall and CPU time spent and
+        the size of the pickled results (only measured if `instrument=True`).
+        Generators returned by the function are run to completion within the worker.
+        '''
+        t0, c0 = time.perf_counter(), time.thread_time()
+        ret = []
+        for el in chunk:
+            rets = self(el, **kwargs)
+            if not isiterator(rets):
+                rets = (rets,)
+            ret.append([r for r in rets if r is not None or not self.skipNone])
+        runtime, cputime = time.perf_counter() - t0, time.thread_time() - c0
+        nbytes = _picklesize(ret) if self._measurebytes else 0
+        return ret, runtime, cputime, nbytes
+
+    def _call_chunk_sharedmem(self, chunk, **kwargs):
+        from . import sharedmem
+        ret, *info = self._call_chunk(sharedmem.unpack(chunk), **kwargs)
+        return (sharedmem.pack_result(ret), *info)
+
+    def _chunks(self, arg):
+        '''
+        Splits the iterator `arg` into lists. Also returns a function, which
+        receives the runtime of the finished chunks to adjust the chunksize.
+        '''
+        auto = self.chunksize == 'auto'
+        chunklen = 1 if auto else self.chunksize
+
+        def chunks():
+            while True:
+                chunk = list(itertools.islice(arg, chunklen))
+                if len(chunk) == 0:
+                    return
+                yield chunk
+
+        def update(n, runtime):
+            nonlocal chunklen
+            if not auto:
+                return
+            best = _AUTOCHUNK_TIME * n / runtime if runtime > 0 else _AUTOCHUNK_MAX
+            # grow carefully: first measurements are noisy.
+            chunklen = int(max(1, min(best, 2 * chunklen, _AUTOCHUNK_MAX)))
+        return chunks(), update
+
     def _call_parallel(self, arg, **kwargs):
         if self.verbose:
-            print(f'parallel execution of "{self.func.__name__}" with {self.nworkers} workers.')
-        with Pool(self.nworkers, maxtasksperchild=self.maxtasksperchild) as pool:
-            cache = deque()
-            for el in arg:
-                cache.append(pool.apply_async(self, (el,), kwargs))
-                if len(cache) < self.cachelen:
-                    # fill cache
-                    continue
-                ret = cache.popleft().get()
+            print(f'parallel execution of "{self._funcname}" with {self.nworkers} '
+                  f'{self._backendname()} workers.')
+        chunks, update = self._chunks(arg)
+        budget = _budget
+        stats = self._instrumentation
+        if stats is not None:
+            chunks = stats.upstreamtimer(chunks)
+            start = time.perf_counter()
+
+        def results(task):
+            ret, runtime, cputime, nbytes = task.get()
+            update(len(ret), runtime)
+            if stats is not None:
+                stats.elements += len(ret)
+                stats.walltime += runtime
+                stats.cputime += cputime
+                stats.bytes_received += nbytes
+            for rets in ret:
                 self.el_processed += 1
-                if ret is not None or not self.skipNone:
+                for r in rets:
                     self.el_yielded += 1
-                    yield ret
-            # flush cache
-            while len(cache) > 0:
-                ret = cache.popleft().get()
-                self.el_processed += 1
-                if ret is not None or not self.skipNone:
+                    if stats is None:
+                        yield r
+                    else:
+                        t0 = time.perf_counter()
+                        yield r
+                        stats.downstream += time.perf_counter() - t0
+
+        with self._poolcontext(budget) as (pool, resources), contextlib.ExitStack() as stack:
+            if stats is not None:
+                @stack.callback
+                def stop():
+                    elapsed = time.perf_counter() - start
+                    stats.elapsed += elapsed
+                    stats.workertime += elapsed * self.nworkers
+            if not pool.pickles:
+                kwargs = _unwrap(kwargs)
+
+                def apply(method, chunk, task):
+                    return pool.submit(getattr(self, method), (chunk,), kwargs,
+                                       callback=task.callback,
+                                       error_callback=task.error_callback)
+            else:
+                # ship the pipeline and the broadcast keyword arguments once per worker
+                # instead of pickling them for every task.
+                from . import registry
+                ref = resources.payload(Pipeline._fromstate, self._workerstate()).ref
+                shared = {k: v.value for k, v in kwargs.items() if isinstance(v, _Broadcast)}
+                kwargs = {k: v for k, v in kwargs.items() if not isinstance(v, _Broadcast)}
+                kwargs['kwref'] = None
+                if shared:
+                    # identical broadcast arguments are kept by the workers between calls.
+                    kwpayload = registry.Payload(dict, shared)
+                    stack.callback(kwpayload.close)
+                    kwargs['kwref'] = kwpayload.ref
+
+                def apply(method, chunk, task):
+                    if stats is not None:
+                        stats.bytes_sent += _picklesize(chunk)
+                    return pool.submit(registry.call, (ref, method, chunk), kwargs,
+                                       callback=task.callback,
+                                       error_callback=task.error_callback)
+            if self._usesharedmem():
+                blocks = resources.blockpool()
+
+                def submit(task, chunk):
+                    packed, task.used = blocks.pack(chunk)
+                    task.blocks = blocks
+                    return apply('_call_chunk_sharedmem', packed, task)
+                yield from self._schedule(_SharedMemoryTask, submit, chunks, results, budget)
+            else:
+                def submit(task, chunk):
+                    return apply('_call_chunk', chunk, task)
+                yield from self._schedule(_Task, submit, chunks, results, budget)
+
+    def _schedule(self, taskcls, submit, chunks, results, budget=None):
+        '''
+        Keeps up to `cachelen` tasks running on the pool. In ordered mode finished
+        tasks are held in a reorder buffer until all preceding tasks have been returned.
+        With a `budget`, each task needs free slots of the budget. These are released as
+        soon as the task has finished.
+        '''
+        # the workers report the index of finished tasks into `done`.
+        done = queue.SimpleQueue()
+        running = dict()
+        finished = dict()  # the reorder buffer
+        maxlen = self.cachelen + (self.reorderbuffer if self.ordered else 0)
+        scaler = self._scaler if self.autoscale else None
+        nextidx = 0
+        chunks = enumerate(chunks)
+        pending = None  # the next chunk, if it is waiting for the budget
+        exhausted = False
+        try:
+            while True:
+                window = self.cachelen if scaler is None else scaler.size
+                # fill cache
+                while (not exhausted and len(running) < window
+                       and len(running) + len(finished) < maxlen):
+                    if pending is None:
+                        try:
+                            pending = next(chunks)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                    if budget is not None:
+                        # only wait for the budget if there is nothing else to do.
+                        idle = len(running) == 0 and nextidx not in finished
+                        if not budget.acquire(self.weight, self.priority, block=idle):
+                            break
+                    (i, chunk), pending = pending, None
+                    task = taskcls(i, done)
+                    if budget is not None:
+                        task.release = functools.partial(budget.release, self.weight)
+                    try:
+                        task.asyncresult = submit(task, chunk)
+                    except BaseException:
+                        # otherwise the slots of the budget would never be released.
+                        task.discard()
+                        raise
+                    running[i] = task
+                if nextidx in finished:
+                    yield from results(finished.pop(nextidx))
+                    nextidx += 1
+                elif len(running) > 0:
+                    blocked = len(running) >= window and done.empty()
+                    if self._instrumentation is not None:
+                        self._instrumentation.window(len(running))
+                    i = done.get()
+                    task = running.pop(i)
+                    if scaler is not None:
+                        scaler.observe(task, blocked)
+                    if self.ordered:
+                        finished[i] = task
+                    else:
+                        yield from results(task)
+                else:
+                    return
+        finally:
+            for task in itertools.chain(running.values(), finished.values()):
+                task.abandon()
+
+    async def _call_async(self, arg, **kwargs):
+        if self.verbose:
+            print(f'async execution of "{self._funcname}" with up to '
+                  f'{max(1, self.cachelen)} coroutines.')
+        if not self._initialized:
+            self._initialize()
+        window = max(1, self.cachelen)
+        maxlen = window + (self.reorderbuffer if self.ordered else 0)
+        running = dict()  # task -> index
+        finished = dict()  # the reorder buffer
+        nextidx = 0
+        i = 0
+        exhausted = False
+
+        def results(task):
+            ret = task.result()
+            self.el_processed += 1
+            if not isiterator(ret):
+                ret = (ret,)
+            return [r for r in ret if r is not None or not self.skipNone]
+
+        try:
+            while True:
+                while (not exhausted and len(running) < window
+                       and len(running) + len(finished) < maxlen):
+                    try:
+                        if isasynciterator(arg):
+                            el = await arg.__anext__()
+                        else:
+                            el = next(arg)
+                    except (StopIteration, StopAsyncIteration):
+                        exhausted = True
+                        break
+                    running[asyncio.ensure_future(self.func(el, **kwargs))] = i
+                    i += 1
+                if nextidx in finished:
+                    ret = results(finished.pop(nextidx))
+                    nextidx += 1
+                elif len(running) > 0:
+                    done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    ret = []
+                    for task in sorted(done, key=running.get):
+                        idx = running.pop(task)
+                        if self.ordered:
+                            finished[idx] = task
+                        else:
+                            ret += results(task)
+                else:
+                    return
+                for r in ret:
                     self.el_yielded += 1
-                    yield ret
+                    yield r
+        finally:
+            for task in running:
+                task.cancel()
+
+    def _pickles(self):
+        if isinstance(self.backend, Backend):
+            return self.backend.pickles
+        return self._backendname() in ('process', 'interpreter', 'ring')
+
+    def _backendname(self):
+        if isinstance(self.backend, Backend):
+            return type(self.backend).__name__
+        if self.backend == 'interpreter' and not interpreters_available():
+            return 'process'
+        return self.backend
+
+    def _usesharedmem(self):
+        return self.transport == 'sharedmem' and self._pickles()
+
+    def _newpool(self):
+        return _newbackend(self._backendname(), self.nworkers, self.maxtasksperchild)
+
+    @contextlib.contextmanager
+    def _poolcontext(self, budget=None):
+        '''
+        Provides the pool and its `_PoolResources` for a single call. A persistent pool is
+        created on first use and kept alive, otherwise the pool is terminated at the end of
+        the call. With a worker `budget`, the pool of the budget is used instead.
+        Backends given by the user are never shut down.
+        '''
+        if isinstance(self.backend, Backend):
+            with _PoolResources() as resources:
+                yield self.backend, resources
+            return
+        if budget is not None and self.backend != 'serial':
+            with _PoolResources() as resources:
+                yield budget.pool(self._backendname()), resources
+            return
+        if not self.persistent:
+            with _PoolResources() as resources, self._newpool() as pool:
+                yield pool, resources
+            return
+        if self._pool is None:
+            if self.verbose:
+                print(f'starting persistent pool for "{self._funcname}".')
+            self._pool = self._newpool()
+            self._resources = _PoolResources()
+            _persistentpipelines.add(self)
+        yield self._pool, self._resources
+
+    def close(self):
+        '''
+        Shut down the persistent pool (if any). The pool will be recreated
+        if the pipeline is used again.
+        '''
+        pool, self._pool = self._pool, None
+        resources, self._resources = self._resources, None
+        _persistentpipelines.discard(self)
+        if pool is not None:
+            pool.shutdown(wait=True)
+        if resources is not None:
+            resources.close()
 
     def __getstate__(self):
         import dill
         return dill.dumps((self.func, self.verbose, self.skipNone,
+                           self.initializer, self.initargs, self.instrument,
                            self.el_processed, self.el_yielded))
 
+    def _workerstate(self):
+        # same as `__getstate__`, but without the statistics. Thus the state only
+        # changes if the pipeline changes and the workers can keep it.
+        import dill
+        return dill.dumps((self.func, self.verbose, self.skipNone,
+                           self.initializer, self.initargs, self.instrument, 0, 0))
+
+    @classmethod
+    def _fromstate(cls, state):
+        ret = cls.__new__(cls)
+        ret.__setstate__(state)
+        return ret
+
     def __setstate__(self, state):
         import dill
-        (self.func, self.verbose, self.skipNone,
-         self.el_processed, self.el_yielded) = dill.loads(state)
-        self.nworkers = 0  # ensure serial execution after sending to another process
+        func, *state = dill.loads(state)
+        self._wrap(func)
+        self.func = func
+        (self.verbose, self.skipNone,
+         self.initializer, self.initargs, self.instrument,
+         self.el_processed, self.el_yielded) = state
+        # ensure serial execution with default settings after sending to another process
+        self.extracache = 0
+        self.maxtasksperchild = None
+        self.persistent = False
+        self._pool = None
+        self._resources = None
+        self.chunksize = 1
+        self.ordered = True
+        self._reorderbuffer = None
+        self.backend = 'process'
+        self.transport = None
+        self.weight = 1
+        self.priority = 0
+        self.autoworkers = False
+        self.autoreason = None
+        self.autoscale = False
+        self._setnworkers(0)
+        # the worker only measures the size of the results, the main process records.
+        self._instrumentation = None
+        self._measurebytes = self.instrument
+        self.isasync = inspect.iscoroutinefunction(self.func)
+        # the initializer runs again in the new process
+        self._initialized = False
+        self._initlock = threading.Lock()
         return self
 
     def pipe_info(self):
-        return Pipe_info(self.el_processed, self.el_yielded)
+        nworkers = None
+        if self.autoscale:
+            nworkers = self._scaler.size
+        elif self.autoworkers and self.autoreason is not None:
+            nworkers = self.nworkers
+        return Pipe_info(self.el_processed, self.el_yielded,
+                         nworkers=nworkers, reason=self.autoreason, stats=self.snapshot())
+
+    def snapshot(self):
+        '''
+        Returns the measurements of `instrument=True` as a dict (`None` if disabled).
+        All times are in seconds and summed up over all calls:
+
+          elements: number of input elements processed
+          walltime, cputime: spent in the function
+          walltime_per_element, cputime_per_element
+          upstream_wait: waiting for the upstream generator
+          downstream_wait: waiting for the consumer to request the next result
+          elapsed: duration of all calls
+          utilization: fraction of the available worker time spent in the function
+          window_mean, window_max: number of tasks in flight (parallel execution only)
+          bytes_sent, bytes_received: size of the pickled elements and results
+            (for backends sending them to other processes)
+        '''
+        if self._instrumentation is None:
+            return None
+        return self._instrumentation.snapshot()
+
+    def __or__(self, other):
+        '''
+        `a | b` fuses the pipelines `a` and `b`. See `fuse`.
+        '''
+        if not isinstance(other, Pipeline):
+            return NotImplemented
+        return fuse(self, other)
+
+
+class _Instrumentation():
+    '''
+    The measurements of a pipeline with `instrument=True`.
+    '''
+
+    def __init__(self):
+        self.elements = 0
+        self.walltime = 0.
+        self.cputime = 0.
+        self.upstream = 0.
+        self.downstream = 0.
+        self.elapsed = 0.
+        self.workertime = 0.  # elapsed time times the number of workers
+        self.windowsum = 0
+        self.windowsamples = 0
+        self.windowmax = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def upstreamtimer(self, gen):
+        '''
+        Records the time spent waiting for the elements of `gen`.
+        '''
+        while True:
+            t0 = time.perf_counter()
+            try:
+                el = next(gen)
+            except StopIteration:
+                return
+            finally:
+                self.upstream += time.perf_counter() - t0
+            yield el
+
+    def window(self, n):
+        self.windowsum += n
+        self.windowsamples += 1
+        self.windowmax = max(self.windowmax, n)
+
+    def snapshot(self):
+        n = max(1, self.elements)
+        return dict(elements=self.elements,
+                    walltime=self.walltime,
+                    cputime=self.cputime,
+                    walltime_per_element=self.walltime / n,
+                    cputime_per_element=self.cputime / n,
+                    upstream_wait=self.upstream,
+                    downstream_wait=self.downstream,
+                    elapsed=self.elapsed,
+                    utilization=self.walltime / self.workertime if self.workertime > 0 else 0.,
+                    window_mean=self.windowsum / max(1, self.windowsamples),
+                    window_max=self.windowmax,
+                    bytes_sent=self.bytes_sent,
+                    bytes_received=self.bytes_received)
+
+
+class _Autoscaler():
+    '''
+    The number of tasks in flight for `autoscale=True`, between 1 and `maxsize`.
+    Each collected task is observed. The size changes only after `patience` consecutive
+    observations of the same kind.
+    '''
+
+    def __init__(self, maxsize, patience=2):
+        self.maxsize = max(1, maxsize)
+        self.size = 1
+        self.patience = patience
+        self._pressure = 0  # > 0: consecutive busy, < 0: consecutive idle observations
+
+    def observe(self, task, blocked):
+        '''
+        `blocked` is True if all tasks were running and the consumer had to wait for them.
+        Otherwise the task is checked for waiting longer than half its runtime to be
+        collected, which means that its worker was starved for a significant time.
+        '''
+        if blocked:
+            self.busy()
+        elif time.perf_counter() - task.finished > (task.finished - task.submitted) / 2:
+            self.idle()
+
+    def busy(self):
+        self._pressure = max(0, self._pressure) + 1
+        if self._pressure >= self.patience:
+            self._pressure = 0
+            self.size = min(self.maxsize, self.size + 1)
+
+    def idle(self):
+        self._pressure = min(0, self._pressure) - 1
+        if -self._pressure >= self.patience:
+            self._pressure = 0
+            self.size = max(1, self.size - 1)
+
+
+def _picklesize(obj):
+    try:
+        return len(pickle.dumps(obj, protocol=5))
+    except Exception:
+        return 0
+
+
+_BACKENDS = ('process', 'thread', 'interpreter', 'ring', 'serial')
+
+
+def _newbackend(name, nworkers, maxtasksperchild=None):
+    if name == 'thread':
+        return ThreadBackend(nworkers)
+    if name == 'interpreter':
+        return InterpreterBackend(nworkers)
+    if name == 'ring':
+        return RingBackend(nworkers)
+    if name == 'serial':
+        return SerialBackend()
+    return ProcessBackend(nworkers, maxtasksperchild=maxtasksperchild)
+
+
+class _Task():
+    '''
+    A chunk of elements submitted to the pool. The index of the task is reported
+    to `done` once the task has finished.
+    '''
+
+    def __init__(self, index, done):
+        self.index = index
+        self.done = done
+        self.asyncresult = None
+        self.submitted = time.perf_counter()
+        self.finished = None
+        self.release = None  # releases the slots of the worker budget
+
+    def _finish(self):
+        if self.release is not None:
+            self.release()
+        self.finished = time.perf_counter()
+        self.done.put(self.index)
+
+    def callback(self, _):
+        self._finish()
+
+    error_callback = callback
+
+    def get(self):
+        return self.asyncresult.get()
+
+    def abandon(self):
+        '''
+        called if the result will never be requested.
+        '''
+        pass
+
+    def discard(self):
+        '''
+        called if the task could not be submitted.
+        '''
+        if self.release is not None:
+            self.release()
+
+
+class _SharedMemoryTask(_Task):
+    '''
+    A task whose arrays have been moved to shared memory. The input blocks are returned
+    to the `BlockPool` and the result blocks are unlinked, once the result has been
+    requested. An abandoned task is waited for, such that its blocks are released before
+    the pool may be terminated.
+    '''
+
+    def __init__(self, index, done):
+        super().__init__(index, done)
+        self.blocks = None
+        self.used = []
+
+    def _release(self):
+        self.blocks.release(self.used)
+        self.used = []
+
+    def get(self):
+        from . import sharedmem
+        try:
+            ret, *info = self.asyncresult.get()
+        finally:
+            self._release()
+        return (sharedmem.unpack_result(ret), *info)
+
+    def abandon(self):
+        from . import sharedmem
+        try:
+            ret = self.asyncresult.get()
+        except Exception:
+            return
+        finally:
+            self._release()
+        sharedmem.discard_result(ret[0])
+
+    def discard(self):
+        super().discard()
+        if self.blocks is not None:
+            self._release()
+
+
+class _PoolResources():
+    '''
+    The shared memory owned by the main process, which lives as long as the pool:
+    the pickled pipelines (`registry.Payload`) and the `sharedmem.BlockPool`.
+    '''
+
+    def __init__(self):
+        self._payloads = dict()
+        self._blockpool = None
+
+    def payload(self, loader, *args):
+        from . import registry
+        payload = registry.Payload(loader, *args)
+        return self._payloads.setdefault(payload.handle, payload)
+
+    def blockpool(self):
+        if self._blockpool is None:
+            from . import sharedmem
+            self._blockpool = sharedmem.BlockPool()
+        return self._blockpool
+
+    def close(self):
+        for payload in self._payloads.values():
+            payload.close()
+        self._payloads.clear()
+        if self._blockpool is not None:
+            self._blockpool.close()
+            self._blockpool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# pipelines holding a persistent pool, which needs to be shut down at exit.
+_persistentpipelines = weakref.WeakSet()
+
+
+@atexit.register
+def _closepersistentpools():
+    for pipe in list(_persistentpipelines):
+        if pipe._pool is not None:
+            pipe._pool.shutdown(wait=False)
+            pipe._pool = None
+        if pipe._resources is not None:
+            pipe._resources.close()
+            pipe._resources = None
+    _persistentpipelines.clear()
+
+
+class _WorkerBudget():
+    '''
+    A number of slots shared by all parallel pipelines of this process, together with
+    the backends executing their tasks.
+    '''
+
+    def __init__(self, nworkers):
+        self.nworkers = nworkers
+        self._free = nworkers
+        self._cond = threading.Condition()
+        self._waiting = []  # heap of (-priority, ticket) waiting for slots
+        self._tickets = itertools.count()
+        self._pools = dict()  # name -> Backend
+
+    def pool(self, backend):
+        with self._cond:
+            if backend not in self._pools:
+                self._pools[backend] = _newbackend(backend, self.nworkers)
+            return self._pools[backend]
+
+    def acquire(self, weight=1, priority=0, block=True):
+        '''
+        Takes `weight` slots. Waiting pipelines are served in the order of their priority.
+        Without `block`, the slots are only taken if they are free and no pipeline with
+        the same or a higher priority is waiting. Returns whether the slots were taken.
+        '''
+        weight = min(weight, self.nworkers)
+        with self._cond:
+            if not block:
+                if self._free < weight or (self._waiting and -self._waiting[0][0] >= priority):
+                    return False
+                self._free -= weight
+                return True
+            entry = (-priority, next(self._tickets))
+            heapq.heappush(self._waiting, entry)
+            try:
+                while self._waiting[0] != entry or self._free < weight:
+                    self._cond.wait()
+                self._free -= weight
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+            return True
+
+    def release(self, weight=1):
+        with self._cond:
+            self._free += min(weight, self.nworkers)
+            self._cond.notify_all()
+
+    @property
+    def busy(self):
+        '''
+        number of slots currently taken.
+        '''
+        return self.nworkers - self._free
+
+    def close(self, wait=True):
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait)
+        self._pools.clear()
+
+
+_budget = None
+
+
+def set_worker_budget(nworkers):
+    '''
+    Limits the number of tasks of all parallel pipelines in this process running at
+    the same time to `nworkers` (`'auto'` for one per CPU). All parallel pipelines
+    then share a single pool of `nworkers` workers (one for each backend) instead of
+    starting their own. The `nworkers` of each pipeline still limits the number of its
+    own tasks in flight. See the `weight` and `priority` arguments of `pipeline`. The
+    `persistent` and `maxtasksperchild` arguments of the pipelines are ignored.
+
+    `set_worker_budget(None)` shuts down the shared pools and returns to separate
+    pools for each pipeline. The budget must not be changed while pipelines are running.
+    '''
+    global _budget
+    if nworkers == 'auto':
+        nworkers = _cpucount()
+    if nworkers is not None and not (isinstance(nworkers, int) and nworkers >= 1):
+        raise ValueError(f"nworkers must be a positive integer, 'auto' or None, not {nworkers}.")
+    budget, _budget = _budget, None
+    if budget is not None:
+        budget.close()
+    if nworkers is not None:
+        _budget = _WorkerBudget(nworkers)
+
+
+@atexit.register
+def _closebudget():
+    if _budget is not None:
+        _budget.close(wait=False)
 
 
 def pipeline(*args, **kwargs):
@@ -155,17 +1176,148 @@ pipeline.__doc__ = Pipeline.__init__.__doc__
 pipeline.__signature__ = inspect.signature(Pipeline)
 
 
+class _Broadcast():
+    '''
+    A keyword argument wrapped by `broadcast`.
+    '''
+
+    def __init__(self, value):
+        self.value = value
+
+
+def broadcast(value):
+    '''
+    Marks `value` as a constant keyword argument of a pipeline call, which is sent to
+    each worker only once instead of with every task, e.g.
+
+        calibrated = calibrate(gen, dark=gp.broadcast(darkframe))
+
+    numpy arrays (also nested in other objects) are placed in shared memory and all
+    workers receive read-only views of the same physical memory. The workers keep
+    the value for following calls with an identical value, so the function must not
+    modify it. This applies to all backends executing the tasks in other processes or
+    interpreters. Serial execution and the `'thread'` backend pass `value` itself.
+    '''
+    return _Broadcast(value)
+
+
+def _unwrap(kwargs):
+    return {k: v.value if isinstance(v, _Broadcast) else v for k, v in kwargs.items()}
+
+
+class _Fused():
+    '''
+    Applies the functions of multiple pipelines one after another to a single element.
+    '''
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.__name__ = ' | '.join(getattr(s, '__name__', repr(s)) for s in stages)
+
+    def setup(self):
+        for stage in self.stages:
+            if not stage._initialized:
+                stage._initialize()
+
+    def __call__(self, el):
+        ret = self._apply(el, 0)
+        return iter(()) if ret is _SKIP else ret
+
+    def _apply(self, el, start):
+        stages = self.stages
+        for i in range(start, len(stages)):
+            stage = stages[i]
+            el = stage.func(el)
+            stage.el_processed += 1
+            if isiterator(el):
+                return self._flatten(el, i + 1)
+            if el is None and stage.skipNone:
+                return _SKIP
+            stage.el_yielded += 1
+        return el
+
+    def _flatten(self, ret, start):
+        # the stage `start - 1` returned multiple elements.
+        stage = self.stages[start - 1]
+        for r in ret:
+            if r is None and stage.skipNone:
+                continue
+            stage.el_yielded += 1
+            r = self._apply(r, start)
+            if r is _SKIP:
+                continue
+            if isiterator(r):
+                yield from r
+            else:
+                yield r
+
+
+# marks an element discarded by a fused stage.
+_SKIP = object()
+
+
+def fuse(*stages, **kwargs):
+    '''
+    Fuses multiple pipelines into a single pipeline, which calls the functions of all stages
+    one after another on each element within a single loop. This avoids the overhead of
+    one generator per stage in long serial pipelines. `fuse(a, b, c)` is equivalent to
+    `a | b | c`.
+
+    The `skipNone` setting of each stage is respected and an element discarded by a stage
+    is not given to the following stages. The statistics (`pipe_info`) of each stage are
+    updated as long as the fused pipeline is executed in the current process.
+
+    kwargs are given to the `Pipeline` of the fused function, e.g.
+    `fuse(a, b, c, nworkers=4)` executes all three stages within 4 worker processes.
+    Keyword arguments for individual stages are not supported. Use `functools.partial`
+    instead.
+    '''
+    flat = []
+    for stage in stages:
+        if not isinstance(stage, Pipeline):
+            raise TypeError(f'{stage} is not a Pipeline.')
+        if stage.isasync:
+            raise TypeError(f'{stage} is a coroutine function and can not be fused.')
+        if isinstance(stage.func, _Fused):
+            flat += stage.func.stages
+        else:
+            flat.append(stage)
+    if len(flat) == 0:
+        raise ValueError('at least one stage required.')
+    kwargs.setdefault('skipNone', flat[-1].skipNone)
+    return Pipeline(_Fused(flat), **kwargs)
+
+
 class Pipe_info():
+    '''
+    Statistics of a pipeline. For `nworkers='auto'`, `nworkers` and `reason`
+    show the number of workers chosen and why (`None` before the decision).
+    For `autoscale=True`, `nworkers` is the current number of busy workers.
+    For `instrument=True`, `stats` holds the measurements (see `Pipeline.snapshot`).
+    '''
 
-    def __init__(self, processed=0, yielded=0):
+    def __init__(self, processed=0, yielded=0, nworkers=None, reason=None, stats=None):
         self.processed = processed
         self.yielded = yielded
+        self.nworkers = nworkers
+        self.reason = reason
+        self.stats = stats
 
     def __str__(self):
         if self.processed > 0:
             s = 'Pipe_info(processed={p}, yielded={y})[{r:.2%}]'
-            return s.format(p=self.processed, y=self.yielded, r=self.yielded/self.processed)
-        s = 'Pipe_info(processed={p}, yielded={y})'
-        return s.format(p=self.processed, y=self.yielded)
+            s = s.format(p=self.processed, y=self.yielded, r=self.yielded/self.processed)
+        else:
+            s = 'Pipe_info(processed={p}, yielded={y})'
+            s = s.format(p=self.processed, y=self.yielded)
+        if self.nworkers is not None:
+            s += f' nworkers={self.nworkers}'
+        if self.reason is not None:
+            s += f': {self.reason}'
+        if self.stats is not None and self.stats['elements'] > 0:
+            s += (' {walltime_per_element:.3g} s/element, upstream_wait={upstream_wait:.3g} s, '
+                  'downstream_wait={downstream_wait:.3g} s, '
+                  'utilization={utilization:.0%}').format(**self.stats)
+        return s
 
     __repr__ = __str__
@@ -20,8 +20,12 @@
 import collections
 
 
-__all__ = ['isiterator']
+__all__ = ['isiterator', 'isasynciterator']
 
 
 def isiterator(x):
     return isinstance(x, collections.abc.Iterator)
+
+
+def isasynciterator(x):
+    return isinstance(x, collections.abc.AsyncIterator)
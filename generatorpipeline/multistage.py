@@ -0,0 +1,192 @@
+# Copyright (C) 2026 Stephan Kuschel
+#
+# This file is part of generatorpipeline.
+#
+# generatorpipeline is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# generatorpipeline is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with generatorpipeline. If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+Pipelined execution of multiple stages, where each stage runs in its own processes.
+The data is sent from stage to stage directly without passing the main process.
+'''
+
+import multiprocessing
+import pickle
+import threading
+import traceback
+from multiprocessing import resource_tracker
+from .generatorpipeline import Pipeline
+from .helper import isiterator
+
+
+__all__ = ['run_stages']
+
+
+class RemoteTraceback(Exception):
+    '''
+    The traceback of an exception raised within a stage worker.
+    '''
+
+    def __init__(self, tb):
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+class _Error():
+    '''
+    An exception raised by a stage. It is forwarded through all following stages.
+    '''
+
+    def __init__(self, exc):
+        self.tb = ''.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+        try:
+            pickle.dumps(exc)
+            self.exc = exc
+        except Exception:
+            self.exc = RuntimeError(repr(exc))
+
+    def reraise(self):
+        raise self.exc from RemoteTraceback(self.tb)
+
+
+def _stageworker(stage, inqueue, outqueue):
+    '''
+    Receives `(key, elements)` from `inqueue` and sends `(key, results)` to `outqueue`
+    until `None` is received. `results` contains the results of all elements
+    (flattened and without `None` if `stage.skipNone`).
+    '''
+    stage._initialize()
+    while True:
+        item = inqueue.get()
+        if item is None:
+            return
+        key, els = item
+        if not isinstance(els, _Error):
+            try:
+                ret = []
+                for el in els:
+                    rets = stage.func(el)
+                    if not isiterator(rets):
+                        rets = (rets,)
+                    ret += [r for r in rets if r is not None or not stage.skipNone]
+                els = ret
+            except Exception as e:
+                els = _Error(e)
+        outqueue.put((key, els))
+
+
+def run_stages(gen, *stages, maxinflight=None, ordered=True):
+    '''
+    Applies all pipelines in `stages` one after another on the elements of `gen`.
+
+    Each stage runs in its own `max(1, stage.nworkers)` many processes at the same time,
+    connected by queues. The data is sent from stage to stage directly and never passes
+    through the main process between the stages. Compared to nesting serial stages within
+    a single parallel pipeline, this overlaps all stages while each stage can use its
+    own number of workers.
+
+    kwargs
+    ------
+      maxinflight = None: int
+        maximum number of input elements processed by all stages at the same time.
+        Defaults to twice the total number of workers.
+      ordered = True:
+        when False, the results are returned in the order they are finished.
+
+    The elements returned by a stage (including all elements of a generator-returning
+    stage) are sent to a single worker of the next stage. Other settings
+    of the stages than `nworkers`, `skipNone`, `initializer` and `initargs` are ignored.
+    `pipe_info` of the stages is not updated, as they run in different processes.
+    '''
+    for stage in stages:
+        if not isinstance(stage, Pipeline):
+            raise TypeError(f'{stage} is not a Pipeline.')
+        if stage.isasync:
+            raise TypeError(f'{stage} is a coroutine function and can not be used here.')
+    if not isiterator(gen):
+        raise ValueError(f'{gen} must be an iterator.')
+    # the arguments are checked above when called, not on the first element.
+    return _run_stages(gen, stages, maxinflight, ordered)
+
+
+def _run_stages(gen, stages, maxinflight, ordered):
+    if len(stages) == 0:
+        yield from gen
+        return
+    nworkers = [max(1, stage.nworkers) for stage in stages]
+    if maxinflight is None:
+        maxinflight = 2 * sum(nworkers)
+    queues = [multiprocessing.Queue() for _ in range(len(stages) + 1)]
+    # each stage has its own processes
+    resource_tracker.ensure_running()
+    procs = [[multiprocessing.Process(target=_stageworker, args=(stage, qin, qout), daemon=True)
+              for _ in range(n)]
+             for stage, n, qin, qout in zip(stages, nworkers, queues[:-1], queues[1:])]
+    for ps in procs:
+        for p in ps:
+            p.start()
+    inflight = threading.Semaphore(maxinflight)
+    stop = threading.Event()
+
+    def feed():
+        # runs in a separate thread and sends the elements of `gen` into the first stage.
+        try:
+            for i, el in enumerate(gen):
+                while not inflight.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                queues[0].put((i, [el]))
+        except Exception as e:
+            queues[-1].put((None, _Error(e)))
+        # shut down the stages one after another
+        for ps, q in zip(procs, queues[:-1]):
+            for _ in ps:
+                q.put(None)
+            for p in ps:
+                p.join()
+        queues[-1].put((None, None))
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    finished = dict()  # the reorder buffer
+    nextkey = 0
+    try:
+        while True:
+            key, ret = queues[-1].get()
+            if isinstance(ret, _Error):
+                ret.reraise()
+            if key is None:
+                # all stages have been shut down.
+                return
+            if not ordered:
+                inflight.release()
+                yield from ret
+                continue
+            finished[key] = ret
+            while nextkey in finished:
+                inflight.release()
+                yield from finished.pop(nextkey)
+                nextkey += 1
+    finally:
+        stop.set()
+        for ps in procs:
+            for p in ps:
+                if p.is_alive():
+                    p.terminate()
+        for q in queues:
+            q.cancel_join_thread()
@@ -0,0 +1,169 @@
+# Copyright (C) 2026 Stephan Kuschel
+#
+# This file is part of generatorpipeline.
+#
+# generatorpipeline is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# generatorpipeline is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with generatorpipeline. If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+Registry of objects, which are shipped to each worker process only once.
+
+The main process pickles the object a single time into a shared memory block (`Payload`).
+Tasks only refer to it by its handle and the name of the block. Each worker loads
+the object on first use and keeps it in its registry for all following tasks.
+
+Large buffers supporting pickle protocol 5 (e.g. numpy arrays) are stored out-of-band.
+The workers receive read-only views into the shared memory block instead of copies,
+so all workers share the same physical memory.
+'''
+
+import hashlib
+import pickle
+import sys
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+
+__all__ = ['Payload', 'call']
+
+# number of objects kept by each worker.
+_CACHESIZE = 32
+
+# number of keyword argument sets kept by each worker (see `call`).
+_KWCACHESIZE = 2
+
+# alignment of the out-of-band buffers within the block.
+_ALIGN = 64
+
+_registry = OrderedDict()  # worker side: handle -> (object, block or None)
+_kwregistry = OrderedDict()  # same for keyword arguments
+_detached = []  # blocks which could not be closed as the data is still referenced
+
+
+def _aligned(n):
+    return -(-n // _ALIGN) * _ALIGN
+
+
+class Payload():
+    '''
+    The object `loader(*args)` pickled into a shared memory block.
+    Owned by the main process. Must be closed after use.
+    '''
+
+    def __init__(self, loader, *args):
+        buffers = []
+        self._data = pickle.dumps((loader, args), protocol=5, buffer_callback=buffers.append)
+        self._buffers = [b.raw() for b in buffers]
+        # identical payloads share the same handle, so workers can keep the loaded object.
+        h = hashlib.sha1(self._data)
+        for b in self._buffers:
+            h.update(b)
+        self.handle = h.hexdigest()
+        self._shm = None
+
+    @property
+    def ref(self):
+        '''
+        handle and name of the shared memory block as required by `call`.
+        The block is created on first access.
+
+        Layout of the block: number of buffers `k`, `k + 1` offsets and sizes of the pickle
+        data and the buffers (all as uint64), followed by the data and the buffers.
+        '''
+        if self._shm is None:
+            parts = [memoryview(self._data)] + self._buffers
+            offset = _aligned(8 * (2 * len(parts) + 1))
+            table = [len(self._buffers)]
+            for part in parts:
+                table += [offset, part.nbytes]
+                offset = _aligned(offset + part.nbytes)
+            self._shm = shared_memory.SharedMemory(create=True, size=max(1, offset))
+            buf = self._shm.buf
+            for i, x in enumerate(table):
+                buf[8 * i:8 * (i + 1)] = x.to_bytes(8, 'little')
+            for part, start, n in zip(parts, table[1::2], table[2::2]):
+                buf[start:start + n] = part.cast('B')
+            self._data, self._buffers = None, None
+        return self.handle, self._shm.name
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+def _read(shm):
+    buf = shm.buf
+    k = int.from_bytes(buf[:8], 'little')
+    table = [int.from_bytes(buf[8 * i:8 * (i + 1)], 'little') for i in range(1, 2 * k + 3)]
+    views = [buf[start:start + n].toreadonly() for start, n in zip(table[::2], table[1::2])]
+    try:
+        loader, args = pickle.loads(views[0], buffers=views[1:])
+    finally:
+        views[0].release()
+    return loader(*args), k > 0
+
+
+def _attach(name):
+    if sys.version_info >= (3, 13):
+        # The block is owned by the main process. Not registering it with a resource
+        # tracker also avoids starting one within subinterpreters.
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def _evict(registry, size):
+    while len(registry) > size:
+        shm = registry.popitem(last=False)[1][1]
+        # the object is dropped first, as it may reference the block.
+        if shm is not None:
+            _detached.append(shm)
+    for shm in list(_detached):
+        try:
+            shm.close()
+            _detached.remove(shm)
+        except BufferError:
+            # still referenced, e.g. by a result of the function. Try again later.
+            pass
+
+
+def load(handle, name, registry=_registry, cachesize=_CACHESIZE):
+    '''
+    Returns the object of the payload. Used by the worker.
+    '''
+    entry = registry.pop(handle, None)
+    if entry is None:
+        shm = _attach(name)
+        obj, hasbuffers = _read(shm)
+        if not hasbuffers:
+            shm.close()
+            shm = None
+        # otherwise the block must be kept open as long as the object references it.
+        entry = (obj, shm)
+    registry[handle] = entry
+    _evict(registry, cachesize)
+    return entry[0]
+
+
+def call(ref, method, *args, kwref=None, **kwargs):
+    '''
+    Calls `method` of the object of the payload referenced by `ref`
+    within the worker. Further keyword arguments are taken from the payload referenced
+    by `kwref`. Only few of them are kept, as they may be large and may differ
+    between calls.
+    '''
+    if kwref is not None:
+        kwargs.update(load(*kwref, _kwregistry, _KWCACHESIZE))
+    return getattr(load(*ref), method)(*args, **kwargs)
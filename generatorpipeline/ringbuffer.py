@@ -0,0 +1,206 @@
+# Copyright (C) 2026 Stephan Kuschel
+#
+# This file is part of generatorpipeline.
+#
+# generatorpipeline is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# generatorpipeline is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with generatorpipeline. If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+Single-producer single-consumer ring buffers in shared memory, used by
+`backends.RingBackend` to talk to its workers with low latency.
+
+A ring is a byte stream. Messages are written as their length (8 bytes) followed by
+the data and may be larger than the ring, as the writer continues as soon as the reader
+has made space. The writer only changes `head` (the number of bytes written), the reader
+only changes `tail` (the number of bytes read), so no locks are needed.
+
+A waiting side first polls for `spin` seconds. Then it sets its flag in the header and
+sleeps on a semaphore, which the other side releases if it sees the flag. The sleep has
+a timeout, so a wakeup lost due to a race only costs a short delay.
+'''
+
+import pickle
+import sys
+import time
+from multiprocessing import shared_memory
+
+
+__all__ = ['Ring']
+
+# header layout (uint64): head, tail, reader waiting, writer waiting.
+_HEAD, _TAIL, _READER, _WRITER = range(4)
+_HEADERSIZE = 64
+
+# maximum time to sleep on a semaphore before checking again.
+_WAIT = 10e-3
+
+
+class Ring():
+    '''
+    A ring of `capacity` bytes. `datasem` is released by the writer to wake the reader,
+    `spacesem` by the reader to wake the writer. Created by the main process
+    (`create=True`) and attached by a worker using the `name` of the block.
+    '''
+
+    def __init__(self, capacity, datasem, spacesem, spin=0, name=None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=_HEADERSIZE + capacity)
+        elif sys.version_info >= (3, 13):
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.capacity = capacity
+        self.datasem = datasem
+        self.spacesem = spacesem
+        self.spin = spin
+        if name is None:
+            self.shm.buf[:_HEADERSIZE] = bytes(_HEADERSIZE)
+        self._header = self.shm.buf[:_HEADERSIZE].cast('Q')
+        self._data = self.shm.buf[_HEADERSIZE:_HEADERSIZE + capacity]
+
+    def __getstate__(self):
+        # sent to the worker to attach the same block.
+        return self.capacity, self.datasem, self.spacesem, self.spin, self.name
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def available(self):
+        '''
+        number of bytes which can be read.
+        '''
+        return self._header[_HEAD] - self._header[_TAIL]
+
+    def setwaiting(self, waiting):
+        '''
+        Marks the reader as waiting, such that the writer releases `datasem`.
+        Used to wait for multiple rings sharing the same `datasem`.
+        '''
+        self._header[_READER] = int(waiting)
+
+    def _wait(self, ready, flag, sem):
+        if ready():
+            return
+        t1 = time.perf_counter() + self.spin
+        while time.perf_counter() < t1:
+            if ready():
+                return
+        while True:
+            self._header[flag] = 1
+            if ready():
+                self._header[flag] = 0
+                return
+            sem.acquire(timeout=_WAIT)
+            self._header[flag] = 0
+            if ready():
+                return
+
+    def _notify(self, flag, sem):
+        if self._header[flag]:
+            sem.release()
+
+    def _put(self, buf):
+        buf = memoryview(buf).cast('B')
+        pos, n = 0, len(buf)
+        while pos < n:
+            self._wait(lambda: self.available() < self.capacity, _WRITER, self.spacesem)
+            head = self._header[_HEAD]
+            start = head % self.capacity
+            k = min(n - pos, self.capacity - self.available(), self.capacity - start)
+            self._data[start:start + k] = buf[pos:pos + k]
+            self._header[_HEAD] = head + k
+            pos += k
+            self._notify(_READER, self.datasem)
+
+    def _get(self, n):
+        ret = bytearray(n)
+        pos = 0
+        while pos < n:
+            self._wait(lambda: self.available() > 0, _READER, self.datasem)
+            tail = self._header[_TAIL]
+            start = tail % self.capacity
+            k = min(n - pos, self.available(), self.capacity - start)
+            ret[pos:pos + k] = self._data[start:start + k]
+            self._header[_TAIL] = tail + k
+            pos += k
+            self._notify(_WRITER, self.spacesem)
+        return ret
+
+    def write(self, data):
+        n = len(data)
+        head = self._header[_HEAD]
+        start = head % self.capacity
+        if (n + 8 <= self.capacity - (head - self._header[_TAIL])
+                and start + n + 8 <= self.capacity):
+            # fast path: the whole message fits without wrapping around.
+            self._data[start:start + 8] = n.to_bytes(8, 'little')
+            self._data[start + 8:start + 8 + n] = data
+            self._header[_HEAD] = head + n + 8
+            self._notify(_READER, self.datasem)
+            return
+        self._put(n.to_bytes(8, 'little'))
+        self._put(data)
+
+    def read(self):
+        '''
+        Waits for the next message and returns it.
+        '''
+        tail = self._header[_TAIL]
+        start = tail % self.capacity
+        available = self._header[_HEAD] - tail
+        if available >= 8 and start + 8 <= self.capacity:
+            n = int.from_bytes(self._data[start:start + 8], 'little')
+            if available >= n + 8 and start + n + 8 <= self.capacity:
+                # fast path: the whole message is there and does not wrap around.
+                ret = bytes(self._data[start + 8:start + 8 + n])
+                self._header[_TAIL] = tail + n + 8
+                self._notify(_WRITER, self.spacesem)
+                return ret
+        return self._get(int.from_bytes(self._get(8), 'little'))
+
+    def close(self, unlink=False):
+        self._header.release()
+        self._data.release()
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _dumps(msg):
+    try:
+        return pickle.dumps(msg, protocol=5)
+    except Exception as e:
+        # the result or exception can not be pickled
+        return pickle.dumps((msg[0], False, RuntimeError(repr(e))), protocol=5)
+
+
+def worker(requests, responses):
+    '''
+    Executes tasks `(taskid, fn, args, kwargs)` received on `requests` and sends
+    `(taskid, success, result or exception)` to `responses` until an empty message
+    is received.
+    '''
+    while True:
+        msg = requests.read()
+        if len(msg) == 0:
+            break
+        taskid, fn, args, kwargs = pickle.loads(msg)
+        try:
+            ret = (taskid, True, fn(*args, **kwargs))
+        except Exception as e:
+            ret = (taskid, False, e)
+        responses.write(_dumps(ret))
+    requests.close()
+    responses.close()
@@ -0,0 +1,227 @@
+# Copyright (C) 2026 Stephan Kuschel
+#
+# This file is part of generatorpipeline.
+#
+# generatorpipeline is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# generatorpipeline is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with generatorpipeline. If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+Transport of numpy arrays between the main process and the workers using shared memory.
+
+Arrays (also nested in tuples, lists and dicts) are copied into shared memory blocks
+and only a small descriptor (`SharedArray`) is sent through the pipe.
+The workers access the input arrays without copying them.
+
+Lifetimes:
+  * Input blocks are owned by the main process. They are taken from a `BlockPool`
+    and returned to it as soon as the task has finished.
+  * Result blocks are created by the worker. The main process copies the data out
+    and unlinks the block immediately.
+'''
+
+from collections import OrderedDict
+from multiprocessing import shared_memory
+import numpy as np
+
+
+__all__ = ['SharedArray', 'BlockPool']
+
+# Arrays smaller than this (in bytes) are pickled as usual.
+MINSIZE = 2**16
+
+# number of blocks, which are kept attached by a worker.
+_ATTACHCACHE = 64
+
+
+class SharedArray():
+    '''
+    Descriptor of a C-contiguous array in a shared memory block.
+    '''
+    __slots__ = ('name', 'shape', 'dtype')
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+    def __getstate__(self):
+        return self.name, self.shape, self.dtype
+
+    def __setstate__(self, state):
+        self.name, self.shape, self.dtype = state
+
+    def ndarray(self, shm):
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+
+    def __repr__(self):
+        return f'<SharedArray {self.name} {self.dtype}{self.shape}>'
+
+
+def _transportable(obj):
+    return (isinstance(obj, np.ndarray) and obj.nbytes >= MINSIZE
+            and not obj.dtype.hasobject)
+
+
+def _walk(obj, f):
+    '''
+    applies `f` to all objects nested in tuples, lists and dicts.
+    '''
+    if type(obj) in (tuple, list):
+        return type(obj)(_walk(x, f) for x in obj)
+    if type(obj) is dict:
+        return {k: _walk(v, f) for k, v in obj.items()}
+    return f(obj)
+
+
+def _toshm(arr, shm):
+    desc = SharedArray(shm.name, arr.shape, arr.dtype.str)
+    desc.ndarray(shm)[...] = arr
+    return desc
+
+
+class BlockPool():
+    '''
+    Shared memory blocks owned by the main process. Blocks are recycled, so
+    steady state operation does not create new blocks.
+    Block sizes are rounded up to powers of two for better reuse.
+    '''
+
+    def __init__(self):
+        self._free = dict()  # size -> list of blocks
+        self._blocks = dict()  # name -> (block, size)
+
+    def _get(self, nbytes):
+        size = 1 << max(12, int(nbytes - 1).bit_length())
+        free = self._free.get(size)
+        if free:
+            return free.pop()
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        self._blocks[shm.name] = (shm, size)
+        return shm
+
+    def pack(self, obj):
+        '''
+        Moves all large arrays in `obj` into shared memory blocks.
+        Returns the packed object and the list of blocks used, which
+        must be given to `release` once the worker has finished.
+        '''
+        used = []
+
+        def f(x):
+            if not _transportable(x):
+                return x
+            shm = self._get(x.nbytes)
+            used.append(shm)
+            return _toshm(x, shm)
+        return _walk(obj, f), used
+
+    def release(self, used):
+        for shm in used:
+            if shm.name in self._blocks:
+                size = self._blocks[shm.name][1]
+                self._free.setdefault(size, []).append(shm)
+
+    def close(self):
+        '''
+        Unlinks all blocks. Workers still attached to a block will keep their
+        mapping until they detach.
+        '''
+        for shm, _ in self._blocks.values():
+            shm.close()
+            shm.unlink()
+        self._blocks.clear()
+        self._free.clear()
+
+
+def unpack_result(obj):
+    '''
+    Used in the main process to restore the arrays sent by a worker via `pack_result`.
+    The data is copied out of the blocks and the blocks are unlinked.
+    '''
+    def f(x):
+        if not isinstance(x, SharedArray):
+            return x
+        shm = shared_memory.SharedMemory(name=x.name)
+        try:
+            return x.ndarray(shm).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+    return _walk(obj, f)
+
+
+def discard_result(obj):
+    '''
+    Unlinks the blocks of a result, which will never be unpacked.
+    '''
+    def f(x):
+        if isinstance(x, SharedArray):
+            shm = shared_memory.SharedMemory(name=x.name)
+            shm.close()
+            shm.unlink()
+    _walk(obj, f)
+
+
+# Worker side
+
+_attached = OrderedDict()  # name -> SharedMemory attached by this worker
+_detached = []  # blocks which could not be closed as the data is still referenced
+
+
+def _attach(name):
+    shm = _attached.pop(name, None)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=name)
+    _attached[name] = shm
+    while len(_attached) > _ATTACHCACHE:
+        _detached.append(_attached.popitem(last=False)[1])
+    for shm in list(_detached):
+        try:
+            shm.close()
+            _detached.remove(shm)
+        except BufferError:
+            # still referenced by the decorated function. Try again later.
+            pass
+    return _attached[name]
+
+
+def unpack(obj):
+    '''
+    Used by the worker to access arrays sent by `BlockPool.pack`.
+    The arrays are read-only views into shared memory and must not be used after
+    the function call, as the main process recycles the block.
+    '''
+    def f(x):
+        if not isinstance(x, SharedArray):
+            return x
+        arr = x.ndarray(_attach(x.name))
+        arr.setflags(write=False)
+        return arr
+    return _walk(obj, f)
+
+
+def pack_result(obj):
+    '''
+    Used by the worker to send large arrays in the result via newly created blocks.
+    The ownership of those blocks is handed over to the main process.
+    '''
+    def f(x):
+        if not _transportable(x):
+            return x
+        shm = shared_memory.SharedMemory(create=True, size=x.nbytes)
+        try:
+            return _toshm(x, shm)
+        finally:
+            shm.close()
+    return _walk(obj, f)
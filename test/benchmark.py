@@ -16,6 +16,16 @@ def pass_parallel(el):
     return el
 
 
+@gp.pipeline(nprocs, chunksize='auto')
+def pass_parallel_chunked(el):
+    return el
+
+
+@gp.pipeline(nprocs, backend='ring')
+def pass_parallel_ring(el):
+    return el
+
+
 @gp.pipeline(nprocs)
 def work(el):
     for _ in range(100):
@@ -68,6 +78,24 @@ def main(n=1e3):
     passtime = (t1 - t0) * 1e6 / n
     print('pass 1 pipe: {:.3f} us/iter (parallel)'.format(passtime))
 
+    gen = iter(range(n))
+    gen = pass_parallel_chunked(gen)
+    t0 = time.time()
+    for el in gen:
+        pass
+    t1 =  time.time()
+    passtime = (t1 - t0) * 1e6 / n
+    print('pass 1 pipe: {:.3f} us/iter (parallel, chunksize=auto)'.format(passtime))
+
+    gen = iter(range(n))
+    gen = pass_parallel_ring(gen)
+    t0 = time.time()
+    for el in gen:
+        pass
+    t1 =  time.time()
+    passtime = (t1 - t0) * 1e6 / n
+    print('pass 1 pipe: {:.3f} us/iter (parallel, ring buffer backend)'.format(passtime))
+
     gen = iter(range(n))
     for _ in range(10):
         gen = pass_serial(gen)
@@ -92,6 +120,28 @@ def main(n=1e3):
     passtime = (t1 - t0) * 1e6 / n
     print('pass 10 pipe: {:.3f} us/iter (parallel each -- dont do that!)'.format(passtime))
 
+    gen = iter(range(n))
+    gen = gp.run_stages(gen, *[pass_parallel] * 10)
+    t0 = time.time()
+    for el in gen:
+        pass
+    t1 =  time.time()
+    passtime = (t1 - t0) * 1e6 / n
+    print('pass 10 pipe: {:.3f} us/iter (run_stages, each stage in own processes)'.format(passtime))
+
+    gp.set_worker_budget('auto')
+    gen = iter(range(n//10))
+    for _ in range(10):
+        # all stages share a single pool with one worker per CPU.
+        gen = pass_parallel(gen)
+    t0 = time.time()
+    for el in gen:
+        pass
+    t1 =  time.time()
+    gp.set_worker_budget(None)
+    passtime = (t1 - t0) * 1e6 / n
+    print('pass 10 pipe: {:.3f} us/iter (parallel each, shared worker budget)'.format(passtime))
+
     gen = iter(range(n))
     for _ in range(100):
         gen = pass_serial(gen)
@@ -103,6 +153,15 @@ def main(n=1e3):
     print('pass 100 pipe: {:.3f} us/iter (serial)'.format(passtime))
 
 
+    gen = iter(range(n))
+    gen = gp.fuse(*[pass_serial] * 100)(gen)
+    t0 = time.time()
+    for el in gen:
+        pass
+    t1 =  time.time()
+    passtime = (t1 - t0) * 1e6 / n
+    print('pass 100 pipe: {:.3f} us/iter (serial fused)'.format(passtime))
+
     gen = iter(range(n))
     gen = work(gen)
     t0 = time.time()
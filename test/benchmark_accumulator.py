@@ -24,6 +24,12 @@ def bench_covariance(n):
     passtime = (t1 - t0) * 1e3 / n
     print('covmatrix numpy (500x500): {:.3f} ms/observation'.format(passtime))
 
+    t0 = time.time()
+    gp.accumulators.Covariance().accumulate_batch(observations)
+    t1 = time.time()
+    passtime = (t1 - t0) * 1e3 / n
+    print('covmatrix batch (500x500): {:.3f} ms/observation'.format(passtime))
+
 
 def bench_variance(n):
     np.random.seed(42)
@@ -44,6 +50,12 @@ def bench_variance(n):
     passtime = (t1 - t0) * 1e3 / n
     print('varaince numpy ({:n}): {:.3f} ms/observation'.format(n, passtime))
 
+    t0 = time.time()
+    gp.accumulators.Variance().accumulate_batch(observations)
+    t1 = time.time()
+    passtime = (t1 - t0) * 1e3 / n
+    print('varaince batch ({:n}): {:.3f} ms/observation'.format(n, passtime))
+
 
 def bench_mean(n):
     np.random.seed(42)
@@ -64,6 +76,12 @@ def bench_mean(n):
     passtime = (t1 - t0) * 1e6 / n
     print('Mean numpy ({:n}): {:.3f} us/observation'.format(n, passtime))
 
+    t0 = time.time()
+    gp.accumulators.Mean().accumulate_batch(observations)
+    t1 = time.time()
+    passtime = (t1 - t0) * 1e6 / n
+    print('Mean batch ({:n}): {:.3f} us/observation'.format(n, passtime))
+
 def bench_median(n):
     np.random.seed(42)
     acc = gp.accumulators.MedianEstimator()
@@ -76,11 +94,24 @@ def bench_median(n):
     passtime = (t1 - t0) * 1e6 / n
     print('MedianEstimator ({:n}): {:.3f} us/observation'.format(n, passtime))
 
+
+def bench_cdf(n):
+    np.random.seed(42)
+    acc = gp.accumulators.CDFEstimator(21)
+    observations = np.random.random((n, 256, 256))
+
+    t0 = time.time()
+    acc.accumulate_batch(observations)
+    t1 = time.time()
+    passtime = (t1 - t0) * 1e3 / n
+    print('CDFEstimator batch (256x256, 21 points): {:.3f} ms/observation'.format(passtime))
+
 def main(n=int(500)):
     bench_covariance(n)
     bench_mean(n*10)
     bench_variance(n*2)
     bench_median(500)
+    bench_cdf(100)
 
 
 
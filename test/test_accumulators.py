@@ -2,7 +2,9 @@
 
 # Stephan Kuschel 2021
 
+import tracemalloc
 import unittest
+from unittest import mock
 import generatorpipeline as gp
 import numpy as np
 
@@ -53,6 +55,19 @@ class _TestAccumulator():
         np.testing.assert_array_almost_equal(acc.value, self.ref(data))
         self.assertEqual(acc.n, len(data))
 
+    def test_2d_accumulate_batch(self):
+        np.random.seed(42)
+        data = np.random.random((100, 5))
+        acc = self.testacc()
+        for d in data[:10]:
+            acc += d
+        acc.accumulate_batch(data[10:60])
+        acc.accumulate_batch(data[60:61])
+        acc.accumulate_batch(data[61:61])
+        acc.accumulate_batch(data[61:].T, axis=1)
+        np.testing.assert_array_almost_equal(acc.value, self.ref(data))
+        self.assertEqual(acc.n, len(data))
+
 
 class TestMean(_TestAccumulator, unittest.TestCase):
 
@@ -84,5 +99,135 @@ class TestCovariance(_TestAccumulator, unittest.TestCase):
         return np.cov(x.T)
 
 
+class TestCovarianceBlocksize(TestCovariance):
+    # observations are left in the buffer
+
+    def testacc(self):
+        return gp.accumulators.Covariance(blocksize=7)
+
+    def test_mean(self):
+        np.random.seed(42)
+        data = np.random.random((10, 5))
+        acc = self.testacc()
+        for d in data:
+            acc += d
+        np.testing.assert_array_almost_equal(acc.mean.value, np.mean(data, axis=0))
+        self.assertEqual(acc.mean.n, len(data))
+
+    def test_running(self):
+        np.random.seed(42)
+        data = np.random.random((10, 5))
+        acc = gp.accumulators.RunningCovariance(lifetime=1e9)
+        acc.accumulate_batch(data)
+        np.testing.assert_array_almost_equal(acc.value, np.cov(data.T))
+
+
+def _dsyrk(alpha, a, beta=0.0, c=None, trans=0, lower=0, overwrite_c=0):
+    # emulates `scipy.linalg.blas.dsyrk` for the arguments used by `Covariance`.
+    assert (trans, lower, overwrite_c) == (0, 0, 1)
+    assert a.flags.f_contiguous and c.flags.f_contiguous
+    full = alpha * a @ a.T + beta * c
+    upper = np.triu_indices(len(c))
+    c[upper] = full[upper]
+    # the lower triangle is not updated by BLAS and must never be used.
+    c[np.tril_indices(len(c), -1)] = np.nan
+    _dsyrk.ncalls += 1
+    return c
+
+
+class TestCovarianceBLAS(TestCovarianceBlocksize):
+
+    def setUp(self):
+        _dsyrk.ncalls = 0
+        patcher = mock.patch.object(gp.accumulators, '_dsyrk', _dsyrk)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_called(self):
+        np.random.seed(42)
+        data = np.random.random((20, 5))
+        acc = self.testacc()
+        for d in data:
+            acc += d
+        np.testing.assert_array_almost_equal(acc.value, np.cov(data.T))
+        self.assertEqual(_dsyrk.ncalls, 3)
+
+    def test_blocksize(self):
+        for blocksize in (0, 1.5):
+            with self.assertRaises(ValueError):
+                gp.accumulators.Covariance(blocksize=blocksize)
+
+
+class TestRunningVariance(unittest.TestCase):
+
+    def test_accumulate_batch(self):
+        np.random.seed(42)
+        data = np.random.random((20, 5))
+        acc = gp.accumulators.RunningVariance(lifetime=4)
+        acc2 = gp.accumulators.RunningVariance(lifetime=4)
+        for d in data:
+            acc += d
+        acc2.accumulate_batch(data)
+        np.testing.assert_array_almost_equal(acc.value, acc2.value)
+        self.assertEqual(acc2.n, len(data))
+
+
+
+class TestInplace(unittest.TestCase):
+
+    def check_noalloc(self, acc, state=lambda acc: acc.value):
+        np.random.seed(42)
+        data = np.random.random((10, 200, 200)).astype(np.float32)
+        acc += data[0]
+        acc += data[1]
+        value = state(acc)
+        tracemalloc.start()
+        try:
+            for d in data[2:]:
+                acc += d
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        # a single temporary array would be 160 kB
+        self.assertLess(peak, data[0].nbytes)
+        self.assertIs(state(acc), value)
+        self.assertEqual(value.dtype, np.float64)
+        return data
+
+    def test_mean(self):
+        acc = gp.accumulators.Mean()
+        data = self.check_noalloc(acc)
+        np.testing.assert_array_almost_equal(acc.value, np.mean(data, axis=0))
+
+    def test_variance(self):
+        acc = gp.accumulators.Variance()
+        data = self.check_noalloc(acc, lambda acc: acc.var.value)
+        np.testing.assert_array_almost_equal(acc.value, np.var(data, axis=0, ddof=1))
+
+    def test_runningmean(self):
+        acc = gp.accumulators.RunningMean(lifetime=3)
+        data = self.check_noalloc(acc, lambda acc: acc.acc)
+        ref = gp.accumulators.RunningMean(lifetime=3)
+        for d in data[:, 0, 0]:
+            ref += float(d)
+        self.assertAlmostEqual(acc.value[0, 0], ref.value)
+
+    def test_runningvariance(self):
+        self.check_noalloc(gp.accumulators.RunningVariance(lifetime=3),
+                           lambda acc: acc.var.acc)
+
+    def test_snapshots(self):
+        # `value` of `Mean` is the state, but `RunningMean` returns a copy
+        mean, rm = gp.accumulators.Mean(), gp.accumulators.RunningMean(lifetime=2)
+        means, rms = [], []
+        for i in range(4):
+            mean += np.full(3, float(i))
+            rm += np.full(3, float(i))
+            means.append(mean.value)
+            rms.append(rm.value)
+        self.assertTrue(all(m is mean.value for m in means))
+        np.testing.assert_array_almost_equal([r[0] for r in rms], [0, 0.5, 1.25, 2.125])
+
+
 if __name__ == '__main__':
     unittest.main()
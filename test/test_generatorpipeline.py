@@ -1,6 +1,19 @@
 #!/usr/bin/env python3
 
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import io
+import pickle
+import subprocess
+import sys
+import os
+import threading
+import time
 import unittest
+from unittest import mock
+import numpy as np
 import generatorpipeline as gp
 
 
@@ -30,8 +43,147 @@ def filter10_parallel(el):
         return el
 
 
+@gp.pipeline(2, persistent=True)
+def square_persistent(el):
+    return el**2
+
+
+@gp.pipeline(2, chunksize=3)
+def square_chunked(el):
+    return el**2
+
+
+@gp.pipeline(2, chunksize='auto')
+def square_autochunked(el):
+    return el**2
+
+
+@gp.pipeline('auto')
+def square_auto(el):
+    return el**2
+
+
+def sleep_short(el):
+    time.sleep(0.005)
+    return el
+
+
+@gp.pipeline(2, autoscale=True)
+def square_autoscale(el):
+    return el**2
+
+
+@gp.pipeline(2, ordered=False)
+def square_unordered(el):
+    return el**2
+
+
+@gp.pipeline(2, ordered=False)
+def sleep_unordered(el):
+    # first element is slow
+    if el == 0:
+        time.sleep(0.5)
+    return el
+
+
+@gp.pipeline(2, reorderbuffer=4)
+def sleep_ordered(el):
+    # first element is slow
+    if el == 0:
+        time.sleep(0.2)
+    return el
+
+
+@gp.pipeline(2, reorderbuffer=0)
+def square_noreorder(el):
+    return el**2
+
+
+@gp.pipeline(2, backend='thread')
+def square_thread(el):
+    return el**2
+
+
+@gp.pipeline(10)
+async def sleep_async(el):
+    await asyncio.sleep(0.1 if el == 0 else 0.01)
+    if el == 10:
+        return
+    return el
+
+
+@gp.pipeline(2, transport='sharedmem')
+def square_sharedmem(el):
+    return el**2
+
+
+@gp.pipeline(2)
+def multiply_parallel(el, y=1, mask=None):
+    return el * y * mask.sum(), mask.flags.writeable
+
+
+@gp.pipeline()
+def duplicate_serial(el):
+    return iter((el, el))
+
+
+@gp.pipeline()
+def fail5_serial(el):
+    if el == 5:
+        raise ValueError('element 5')
+    return el
+
+
+@gp.pipeline(2)
+def tiles_parallel(el):
+    # inserts elements into the stream
+    for i in range(el % 4):
+        yield None if i == 1 else (el, i)
+
+
+class CountUnpickling():
+    # counts how often an instance has been unpickled within the current process.
+    nloads = 0
+
+    def __init__(self):
+        self.state = True
+
+    def __setstate__(self, state):
+        CountUnpickling.nloads += 1
+
+    def __call__(self, el):
+        return CountUnpickling.nloads
+
+
+class CountSetup():
+    # counts how often `setup` has been called on this instance.
+    nsetup = 0
+
+    def setup(self):
+        self.nsetup += 1
+
+    def __call__(self, el):
+        return self.nsetup
+
+
+_initvalue = None
+
+
+def _setinitvalue(value):
+    global _initvalue
+    _initvalue = value
+
+
+def initvalue(el):
+    return _initvalue
+
+
 class _TestPipeline():
 
+    def assertStreamEqual(self, gen, ref):
+        self.assertListEqual(list(gen), ref)
+
+
     def test_el(self):
         # function should behave as undecorated with normal arguments
         r = self.squaref(7)
@@ -42,21 +194,26 @@ class _TestPipeline():
         gen = (i for i in range(20))
         gen = self.squaref(gen)
         sq = [i**2 for i in range(20)]
-        self.assertListEqual(list(gen), sq)
+        self.assertStreamEqual(gen, sq)
+
+    def test_chain(self):
+        # the same pipeline applied twice at the same time
+        gen = self.squaref(self.squaref(iter(range(20))))
+        self.assertStreamEqual(gen, [i**4 for i in range(20)])
 
     def test_discard_s(self):
         gen = (i for i in range(20))
         gen = filter10_serial(gen)
         gen = self.squaref(gen)
         sq = [i**2 for i in range(20) if i != 10]
-        self.assertListEqual(list(gen), sq)
+        self.assertStreamEqual(gen, sq)
 
     def test_discard_p(self):
         gen = (i for i in range(20))
         gen = filter10_parallel(gen)
         gen = self.squaref(gen)
         sq = [i**2 for i in range(20) if i != 10]
-        self.assertListEqual(list(gen), sq)
+        self.assertStreamEqual(gen, sq)
 
 
 class TestPipeline_serial(_TestPipeline, unittest.TestCase):
@@ -64,12 +221,640 @@ class TestPipeline_serial(_TestPipeline, unittest.TestCase):
     def setUp(self):
         self.squaref = square_serial
 
+    def test_setup(self):
+        stage = CountSetup()
+        f = gp.pipeline(0)(stage)
+        self.assertEqual(stage.nsetup, 0)  # not called before the first element
+        self.assertListEqual(list(f(iter(range(5)))), [1] * 5)
+        self.assertEqual(f(5), 1)
+
+    def test_pickle(self):
+        # e.g. sent by value by dill within another stage
+        for f in (square_parallel, gp.pipeline('auto')(abs), gp.pipeline(0)(CountSetup())):
+            f2 = pickle.loads(pickle.dumps(f))
+            self.assertEqual(f2.nworkers, 0)
+            info = f2.pipe_info()
+            self.assertEqual((info.processed, info.yielded), (f.el_processed, f.el_yielded))
+            self.assertEqual(len(list(f2(iter(range(5))))), 5)
+
+    def test_stage_attributes(self):
+        # attributes of a stage must not change the settings of the pipeline
+        stage = CountSetup()
+        stage.backend = 'gpu'
+        stage.verbose = 'yes'
+        stage.nworkers = 5
+        for nworkers in (0, 2):
+            f = gp.pipeline(nworkers)(stage)
+            self.assertEqual((f.backend, f.verbose, f.nworkers), ('process', False, nworkers))
+            self.assertEqual(len(list(f(iter(range(5))))), 5)
+        with contextlib.redirect_stdout(io.StringIO()):
+            f = gp.pipeline(0, verbose=True)(stage)
+            self.assertEqual(len(list(f(iter(range(5))))), 5)
+
 
 class TestPipeline_parallel(_TestPipeline, unittest.TestCase):
 
     def setUp(self):
         self.squaref = square_parallel
 
+    def test_shiponce(self):
+        # the function must be unpickled only once per worker
+        f = gp.pipeline(2)(CountUnpickling())
+        self.assertListEqual(list(f(iter(range(20)))), [1] * 20)
+
+    def test_setup(self):
+        # `setup` must be called exactly once per worker
+        f = gp.pipeline(2)(CountSetup())
+        self.assertListEqual(list(f(iter(range(20)))), [1] * 20)
+
+    def test_initializer(self):
+        f = gp.pipeline(2, initializer=_setinitvalue, initargs=(5,))(initvalue)
+        self.assertListEqual(list(f(iter(range(10)))), [5] * 10)
+
+    def test_kwargs(self):
+        # each call receives a writeable copy
+        mask = np.ones((100, 100))
+        ret = list(multiply_parallel(iter(range(10)), y=3, mask=mask))
+        self.assertListEqual(ret, [(i * 3 * 1e4, True) for i in range(10)])
+
+    def test_broadcast(self):
+        mask = np.ones((100, 100))
+        ret = list(multiply_parallel(iter(range(10)), y=3, mask=gp.broadcast(mask)))
+        self.assertListEqual(ret, [(i * 3 * 1e4, False) for i in range(10)])
+        multiply = gp.pipeline()(multiply_parallel.func)
+        ret = list(multiply(iter(range(10)), y=3, mask=gp.broadcast(mask)))
+        self.assertListEqual(ret, [(i * 3 * 1e4, True) for i in range(10)])
+
+    def test_generator(self):
+        ret = list(tiles_parallel(iter(range(20))))
+        self.assertListEqual(ret, [(el, i) for el in range(20) for i in range(el % 4) if i != 1])
+
+    def test_straggler(self):
+        ret = list(sleep_ordered(iter(range(10))))
+        self.assertListEqual(ret, list(range(10)))
+
+
+class TestPipeline_persistent(_TestPipeline, unittest.TestCase):
+
+    def setUp(self):
+        self.squaref = square_persistent
+
+    def test_poolreuse(self):
+        list(self.squaref(iter(range(5))))
+        pool = self.squaref._pool
+        self.assertIsNotNone(pool)
+        self.assertListEqual(list(self.squaref(iter(range(5)))), [i**2 for i in range(5)])
+        self.assertIs(self.squaref._pool, pool)
+        self.squaref.close()
+        self.assertIsNone(self.squaref._pool)
+
+
+class TestPipeline_chunked(_TestPipeline, unittest.TestCase):
+
+    def setUp(self):
+        self.squaref = square_chunked
+
+    def test_invalidchunksize(self):
+        with self.assertRaises(ValueError):
+            gp.pipeline(2, chunksize=0)(abs)
+
+
+class TestPipeline_autochunked(_TestPipeline, unittest.TestCase):
+
+    def setUp(self):
+        self.squaref = square_autochunked
+
+
+class TestPipeline_auto(_TestPipeline, unittest.TestCase):
+
+    def setUp(self):
+        self.squaref = square_auto
+
+    def test_serial(self):
+        # much faster than the communication overhead
+        f = gp.pipeline('auto')(square_serial.func)
+        self.assertIsNone(f.pipe_info().reason)
+        self.assertIsNone(f.pipe_info().nworkers)
+        self.assertStreamEqual(f(iter(range(20))), [i**2 for i in range(20)])
+        info = f.pipe_info()
+        self.assertEqual(info.processed, 20)
+        self.assertEqual(info.nworkers, 0)
+        self.assertTrue(info.reason.startswith('serial'))
+
+    def test_parallel(self):
+        f = gp.pipeline('auto')(sleep_short)
+        with mock.patch('generatorpipeline.generatorpipeline._cpucount', return_value=4):
+            self.assertStreamEqual(f(iter(range(20))), list(range(20)))
+        info = f.pipe_info()
+        self.assertEqual(info.nworkers, 4)
+        self.assertEqual(info.processed, 20)
+        self.assertIn('4 process workers', str(info))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            gp.pipeline('many')(sleep_short)
+
+
+class TestPipeline_autoscale(_TestPipeline, unittest.TestCase):
+
+    def setUp(self):
+        self.squaref = square_autoscale
+
+    def test_scaling(self):
+        f = gp.pipeline(4, autoscale=True, backend='thread')(sleep_short)
+        self.assertEqual(f.pipe_info().nworkers, 1)
+        # the workers are the bottleneck
+        self.assertStreamEqual(f(iter(range(30))), list(range(30)))
+        self.assertEqual(f.pipe_info().nworkers, 4)
+
+        # the upstream generator is the bottleneck. A second task in flight
+        # still overlaps the upstream generator with the worker.
+        def slow():
+            for i in range(30):
+                time.sleep(0.01)
+                yield i
+        self.assertStreamEqual(f(slow()), list(range(30)))
+        self.assertLessEqual(f.pipe_info().nworkers, 2)
+
+
+class TestPipeline_noreorder(_TestPipeline, unittest.TestCase):
+
+    def setUp(self):
+        self.squaref = square_noreorder
+
+
+class TestPipeline_thread(_TestPipeline, unittest.TestCase):
+
+    def setUp(self):
+        self.squaref = square_thread
+
+    def test_nocopy(self):
+        # elements are not pickled for the thread backend
+        data = [[i] for i in range(10)]
+        ident = gp.pipeline(2, backend='thread')(lambda x: x)
+        for d, r in zip(data, ident(iter(data))):
+            self.assertIs(d, r)
+
+    def test_iterator(self):
+        # returned iterators are flattened as in serial execution
+        dup = gp.pipeline(2, backend='thread')(lambda x: iter((x, None, x)))
+        self.assertListEqual(list(dup(iter(range(5)))), [0, 0, 1, 1, 2, 2, 3, 3, 4, 4])
+        self.assertEqual(dup.pipe_info().yielded, 10)
+
+
+class TestPipeline_serialbackend(_TestPipeline, unittest.TestCase):
+
+    def setUp(self):
+        self.squaref = gp.pipeline(2, backend='serial')(square_serial.func)
+
+    def test_stats(self):
+        backend = gp.backends.SerialBackend()
+        f = gp.pipeline(2, backend=backend)(fail5_serial.func)
+        with self.assertRaises(ValueError):
+            list(f(iter(range(10))))
+        stats = backend.stats()
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['submitted'], stats['completed'] + 1)
+
+
+class TestPipeline_interpreter(_TestPipeline, unittest.TestCase):
+
+    def setUp(self):
+        # this module imports numpy, so the function must be defined elsewhere to be
+        # usable within subinterpreters.
+        self.squaref = gp.pipeline(2, backend='interpreter')(functools.partial(pow, exp=2))
+
+    def test_fallback(self):
+        name = 'interpreter' if gp.backends.interpreters_available() else 'process'
+        self.assertEqual(self.squaref._backendname(), name)
+
+    def test_import(self):
+        # the workers must be able to import the package without numpy
+        code = ('import sys, generatorpipeline, generatorpipeline.registry; '
+                'assert "numpy" not in sys.modules')
+        subprocess.run([sys.executable, '-c', code], check=True,
+                       cwd=os.path.dirname(os.path.dirname(gp.__file__)))
+
+    @unittest.skipUnless(gp.backends.interpreters_available(), 'requires python 3.14')
+    def test_interpreter(self):
+        f = gp.pipeline(2, backend='interpreter', persistent=True)(functools.partial(pow, exp=3))
+        try:
+            self.assertListEqual(list(f(iter(range(20)))), [i**3 for i in range(20)])
+        finally:
+            f.close()
+
+    @unittest.skipIf(gp.backends.interpreters_available(), 'this module imports numpy')
+    def test_shiponce(self):
+        f = gp.pipeline(2, backend='interpreter', persistent=True)(CountUnpickling())
+        self.assertListEqual(list(f(iter(range(20)))), [1] * 20)
+        f.close()
+
+
+class TestPipeline_ring(_TestPipeline, unittest.TestCase):
+
+    def setUp(self):
+        self.squaref = gp.pipeline(2, backend='ring')(square_serial.func)
+
+    def test_shiponce(self):
+        f = gp.pipeline(2, backend='ring')(CountUnpickling())
+        self.assertListEqual(list(f(iter(range(20)))), [1] * 20)
+
+    def test_large(self):
+        # messages larger than the ring are streamed
+        backend = gp.backends.RingBackend(2, capacity=4096)
+        data = [np.arange(i * 1000) for i in range(10)]
+        f = gp.pipeline(2, backend=backend)(lambda x: x * 2)
+        for d, r in zip(data, f(iter(data))):
+            np.testing.assert_array_equal(r, d * 2)
+        backend.shutdown()
+
+    def test_error(self):
+        f = gp.pipeline(2, backend='ring')(fail5_serial.func)
+        with self.assertRaises(ValueError):
+            list(f(iter(range(10))))
+
+    def test_unpicklable(self):
+        # reported to the error_callback like any other failure
+        errors = []
+        with gp.backends.RingBackend(2) as backend:
+            result = backend.submit(len, (threading.Lock(),), error_callback=errors.append)
+            with self.assertRaises(TypeError):
+                result.get()
+            self.assertEqual(len(errors), 1)
+            self.assertEqual(backend.stats()['failed'], 1)
+
+    def test_deadworker(self):
+        with gp.backends.RingBackend(2) as backend:
+            backend._procs[0].kill()
+            backend._procs[0].join()
+            self.assertListEqual(list(backend.map_window(abs, range(-6, 0), 3)),
+                                 [6, 5, 4, 3, 2, 1])
+            backend._procs[1].kill()
+            backend._procs[1].join()
+            with self.assertRaises(RuntimeError):
+                backend.submit(abs, (1,)).get()
+
+    def test_submit_error(self):
+        # the slot of the budget is released and the next pipeline does not hang
+        gp.set_worker_budget(1)
+        try:
+            f = gp.pipeline(1, backend='ring')(square_serial.func)
+            with self.assertRaises(TypeError):
+                list(f(iter([threading.Lock()])))
+            self.assertEqual(gp.generatorpipeline._budget.busy, 0)
+            self.assertListEqual(list(f(iter(range(5)))), [i**2 for i in range(5)])
+        finally:
+            gp.set_worker_budget(None)
+
+
+class TestPipeline_executor(_TestPipeline, unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.executor = concurrent.futures.ProcessPoolExecutor(2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown()
+
+    def setUp(self):
+        self.squaref = gp.pipeline(2, backend=self.executor)(square_serial.func)
+
+    def test_shiponce(self):
+        f = gp.pipeline(2, backend=self.executor)(CountUnpickling())
+        self.assertListEqual(list(f(iter(range(20)))), [1] * 20)
+
+    def test_threads(self):
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            ident = gp.pipeline(2, backend=executor)(lambda x: x)
+            self.assertFalse(ident.backend.pickles)
+            data = [[i] for i in range(10)]
+            for d, r in zip(data, ident(iter(data))):
+                self.assertIs(d, r)
+
+    def test_map_window(self):
+        backend = gp.backends.ExecutorBackend(self.executor)
+        ret = backend.map_window(abs, iter(range(-10, 10)), window=4)
+        self.assertListEqual(list(ret), [abs(i) for i in range(-10, 10)])
+        self.assertEqual(backend.stats()['completed'], 20)
+
+
+class TestPipeline_unordered(_TestPipeline, unittest.TestCase):
+
+    def setUp(self):
+        self.squaref = square_unordered
+
+    def assertStreamEqual(self, gen, ref):
+        self.assertListEqual(sorted(gen), sorted(ref))
+
+    def test_nostall(self):
+        ret = list(sleep_unordered(iter(range(10))))
+        self.assertListEqual(sorted(ret), list(range(10)))
+        self.assertNotEqual(ret[0], 0)
+
+
+class TestPipeline_sharedmem(_TestPipeline, unittest.TestCase):
+
+    def setUp(self):
+        self.squaref = square_sharedmem
+
+    def test_arrays(self):
+        data = [(np.full((200, 100), i, dtype=float), {'i': i}) for i in range(10)]
+
+        @gp.pipeline(2, transport='sharedmem')
+        def f(el):
+            arr, d = el
+            return [arr.sum(), arr * 2, d['i']]
+        ret = list(f(iter(data)))
+        self.assertEqual(len(ret), 10)
+        for i, (s, arr, di) in enumerate(ret):
+            self.assertEqual(s, 200 * 100 * i)
+            self.assertEqual(di, i)
+            np.testing.assert_array_equal(arr, 2 * data[i][0])
+
+    def test_chain_arrays(self):
+        # the inner call ends while the outer call still uses the shared memory
+        @gp.pipeline(8, transport='sharedmem')
+        def f(el):
+            return el**2
+        data = [np.full((200, 100), i, dtype=float) for i in range(3)]
+        ret = list(f(f(iter(data))))
+        self.assertEqual(len(ret), 3)
+        for i, arr in enumerate(ret):
+            np.testing.assert_array_equal(arr, data[i]**4)
+
+    @unittest.skipUnless(os.path.isdir('/dev/shm'), 'requires /dev/shm')
+    def test_close_early(self):
+        data = [np.full((200, 100), i, dtype=float) for i in range(20)]
+
+        @gp.pipeline(2, transport='sharedmem', extracache=4)
+        def f(arr):
+            time.sleep(0.01)
+            return arr * 2
+        # name the blocks of this test (including those created by the forked workers),
+        # as other processes may create and unlink blocks at the same time.
+        prefix = f'/p{os.getpid():06x}_'
+        with mock.patch('multiprocessing.shared_memory._SHM_NAME_PREFIX', prefix):
+            for _ in range(3):
+                gen = f(iter(data))
+                next(gen)
+                gen.close()
+        leaked = [n for n in os.listdir('/dev/shm') if n.startswith(prefix[1:])]
+        self.assertListEqual(leaked, [])
+
+    def test_close_early_persistent(self):
+        data = [np.full((200, 100), i, dtype=float) for i in range(20)]
+
+        @gp.pipeline(2, transport='sharedmem', persistent=True)
+        def f(arr):
+            return arr * 2
+        try:
+            for _ in range(3):
+                gen = f(iter(data))
+                next(gen)
+                gen.close()
+            blocks = f._resources.blockpool()
+            # all input blocks have been returned for reuse
+            self.assertEqual(sum(map(len, blocks._free.values())), len(blocks._blocks))
+        finally:
+            f.close()
+
+    def test_submit_error(self):
+        data = [np.full((200, 100), i, dtype=float) for i in range(5)]
+
+        @gp.pipeline(2, transport='sharedmem', persistent=True)
+        def f(arr):
+            return arr * 2
+        try:
+            with mock.patch.object(gp.backends.ProcessBackend, '_submit', side_effect=OSError):
+                with self.assertRaises(OSError):
+                    list(f(iter(data)))
+            blocks = f._resources.blockpool()
+            self.assertGreater(len(blocks._blocks), 0)
+            self.assertEqual(sum(map(len, blocks._free.values())), len(blocks._blocks))
+        finally:
+            f.close()
+
+
+class TestRegistry(unittest.TestCase):
+
+    def test_kwargs(self):
+        from generatorpipeline import registry
+        kwargs = [dict(mask=np.full((100, 100), i)) for i in range(5)]
+        payloads = [registry.Payload(dict, kw) for kw in kwargs]
+        # identical keyword arguments are reused by the workers
+        self.assertEqual(registry.Payload(dict, kwargs[0]).handle, payloads[0].handle)
+        try:
+            # the array keeps the block of the first payload referenced
+            mask = registry.load(*payloads[0].ref, registry._kwregistry, 2)['mask']
+            for p in payloads[1:]:
+                registry.load(*p.ref, registry._kwregistry, 2)
+            self.assertEqual(len(registry._kwregistry), 2)
+            self.assertEqual(len(registry._detached), 1)
+            self.assertEqual(mask.sum(), 0)
+            del mask
+            registry._evict(registry._kwregistry, 0)
+            self.assertEqual(len(registry._detached), 0)
+        finally:
+            registry._evict(registry._kwregistry, 0)
+            for p in payloads:
+                p.close()
+
+
+class TestPipeline_fused(_TestPipeline, unittest.TestCase):
+
+    def setUp(self):
+        self.squaref = gp.fuse(square_serial)
+
+    def test_fuse(self):
+        ref = list(square_serial(duplicate_serial(filter10_serial(iter(range(20))))))
+        f = filter10_serial | duplicate_serial | square_serial
+        self.assertEqual(len(f.func.stages), 3)
+        self.assertListEqual(list(f(iter(range(20)))), ref)
+
+    def test_pipe_info(self):
+        f1 = gp.pipeline()(filter10_serial.func)
+        f2 = gp.pipeline()(duplicate_serial.func)
+        f3 = gp.pipeline()(square_serial.func)
+        list(gp.fuse(f1, f2, f3)(iter(range(20))))
+        self.assertEqual((f1.el_processed, f1.el_yielded), (20, 19))
+        self.assertEqual((f2.el_processed, f2.el_yielded), (19, 38))
+        self.assertEqual((f3.el_processed, f3.el_yielded), (38, 38))
+
+    def test_parallel(self):
+        f = gp.fuse(filter10_serial, square_serial, nworkers=2)
+        self.assertListEqual(list(f(iter(range(20)))), [i**2 for i in range(20) if i != 10])
+
+
+class Concurrency():
+    # measures the maximum number of concurrent calls (thread backend only)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max = 0
+
+    def __call__(self, el):
+        with self.lock:
+            self.running += 1
+            self.max = max(self.max, self.running)
+        time.sleep(0.002)
+        with self.lock:
+            self.running -= 1
+        return el
+
+
+class TestWorkerBudget(unittest.TestCase):
+
+    def setUp(self):
+        gp.set_worker_budget(2)
+
+    def tearDown(self):
+        gp.set_worker_budget(None)
+
+    def test_chain(self):
+        ret = square_parallel(filter10_parallel(iter(range(50))))
+        self.assertListEqual(list(ret), [i**2 for i in range(50) if i != 10])
+        self.assertEqual(gp.generatorpipeline._budget.busy, 0)
+
+    def test_submit_error(self):
+        f = gp.pipeline(2, backend='thread')(square_serial.func)
+        with mock.patch.object(gp.backends.ThreadBackend, '_submit', side_effect=OSError):
+            with self.assertRaises(OSError):
+                list(f(iter(range(5))))
+        self.assertEqual(gp.generatorpipeline._budget.busy, 0)
+        self.assertListEqual(list(f(iter(range(5)))), [i**2 for i in range(5)])
+
+    def test_limit(self):
+        c = Concurrency()
+        f = gp.pipeline(4, backend='thread')(c)
+        self.assertListEqual(list(f(f(f(iter(range(50)))))), list(range(50)))
+        self.assertEqual(c.max, 2)
+
+    def test_weight(self):
+        c = Concurrency()
+        f = gp.pipeline(4, backend='thread', weight=2)(c)
+        self.assertListEqual(list(f(iter(range(20)))), list(range(20)))
+        self.assertEqual(c.max, 1)
+
+    def test_priority(self):
+        budget = gp.generatorpipeline._WorkerBudget(1)
+        budget.acquire()
+        order = []
+
+        def waiter(priority):
+            budget.acquire(priority=priority)
+            order.append(priority)
+            budget.release()
+        threads = [threading.Thread(target=waiter, args=(p,)) for p in (0, 5)]
+        for t in threads:
+            t.start()
+            time.sleep(0.05)
+        self.assertFalse(budget.acquire(priority=5, block=False))
+        budget.release()
+        for t in threads:
+            t.join()
+        self.assertListEqual(order, [5, 0])
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    @staticmethod
+    def slow(n):
+        for i in range(n):
+            time.sleep(0.005)
+            yield i
+
+    def check(self, f, nbytes=False):
+        for r in f(self.slow(10)):
+            time.sleep(0.005)
+        stats = f.pipe_info().stats
+        self.assertEqual(stats['elements'], 10)
+        self.assertGreater(stats['walltime_per_element'], 0.004)
+        self.assertGreater(stats['upstream_wait'], 0.04)
+        self.assertGreater(stats['downstream_wait'], 0.04)
+        self.assertGreater(stats['utilization'], 0)
+        self.assertEqual(stats['bytes_received'] > 0, nbytes)
+        return stats
+
+    def test_disabled(self):
+        f = gp.pipeline()(sleep_short)
+        self.assertIsNone(f.snapshot())
+        self.assertIsNone(f.pipe_info().stats)
+
+    def test_serial(self):
+        self.check(gp.pipeline(instrument=True)(sleep_short))
+
+    def test_parallel(self):
+        stats = self.check(gp.pipeline(2, instrument=True)(sleep_short), nbytes=True)
+        self.assertEqual(stats['window_max'], 2)
+
+    def test_thread(self):
+        self.check(gp.pipeline(2, instrument=True, backend='thread')(sleep_short))
+
+
+class TestRunStages(unittest.TestCase):
+
+    def test_stages(self):
+        ref = list(square_serial(duplicate_serial(filter10_serial(iter(range(50))))))
+        ret = gp.run_stages(iter(range(50)), filter10_parallel, duplicate_serial, square_parallel)
+        self.assertListEqual(list(ret), ref)
+
+    def test_unordered(self):
+        ret = gp.run_stages(iter(range(50)), filter10_parallel, square_parallel, ordered=False)
+        self.assertListEqual(sorted(ret), [i**2 for i in range(50) if i != 10])
+
+    def test_error(self):
+        ret = gp.run_stages(iter(range(50)), fail5_serial, square_parallel)
+        with self.assertRaises(ValueError):
+            list(ret)
+
+    def test_arguments(self):
+        # checked when called, not on the first element
+        with self.assertRaises(TypeError):
+            gp.run_stages(iter(range(3)), abs)
+        with self.assertRaises(ValueError):
+            gp.run_stages(range(3), square_serial)
+
+    def test_setup(self):
+        ret = gp.run_stages(iter(range(20)), gp.pipeline(2)(CountSetup()))
+        self.assertListEqual(list(ret), [1] * 20)
+
+    def test_close(self):
+        ret = gp.run_stages(iter(range(1000)), square_parallel, square_serial)
+        self.assertEqual(next(ret), 0)
+        ret.close()
+
+
+class TestPipeline_async(unittest.TestCase):
+
+    @staticmethod
+    def collect(agen):
+        async def main():
+            return [el async for el in agen]
+        return asyncio.run(main())
+
+    def test_el(self):
+        self.assertEqual(asyncio.run(sleep_async(7)), 7)
+
+    def test_gen(self):
+        t0 = time.time()
+        ret = self.collect(sleep_async(iter(range(20))))
+        self.assertLess(time.time() - t0, 1)
+        self.assertListEqual(ret, [i for i in range(20) if i != 10])
+
+    def test_asyncgen(self):
+        async def agen():
+            for i in range(5):
+                yield i
+        self.assertListEqual(self.collect(sleep_async(agen())), list(range(5)))
+
+    def test_unordered(self):
+        pipe = gp.pipeline(10, ordered=False)(sleep_async.func)
+        ret = self.collect(pipe(iter(range(5))))
+        self.assertListEqual(sorted(ret), list(range(5)))
+        self.assertEqual(ret[-1], 0)
+
 
 if __name__ == '__main__':
     unittest.main()
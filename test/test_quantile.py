@@ -3,6 +3,7 @@
 # Robert Radloff 2022
 # Stephan Kuschel 2022-2023
 
+import tracemalloc
 import unittest
 import numpy as np
 import generatorpipeline as gp
@@ -231,5 +232,83 @@ class TestMedian(unittest.TestCase):
         self.checkaccvalues(median, zip(sample2, sample3, sample4), zip(sample2_medians, sample3_medians, sample4_medians))
 
 
+    def test_1d_paperdata_batch(self):
+        quant = gp.accumulators.QuantileEstimator(p=0.5)
+        quant.accumulate(paper_sample_values[0])
+        quant.accumulate_batch(paper_sample_values[1:3])
+        quant.accumulate_batch(paper_sample_values[3:])
+        n, pos, height = quant._debug_info
+        self.assertEqual(n, len(paper_sample_values))
+        self.assertEqual(paper_sample_m_pos[-1], list(pos))
+        self.assertTrue(np.allclose(paper_sample_m_height[-1], list(height)))
+
+    def test_2d_batch(self):
+        np.random.seed(42)
+        data = np.random.normal(size=(200, 3, 4))
+        cdf = gp.accumulators.CDFEstimator(7)
+        for d in data:
+            cdf.accumulate(d)
+        cdf2 = gp.accumulators.CDFEstimator(7)
+        cdf2.accumulate_batch(data.transpose(1, 0, 2), axis=1)
+        np.testing.assert_array_equal(cdf.m_pos, cdf2.m_pos)
+        np.testing.assert_array_equal(cdf.m_height, cdf2.m_height)
+
+
+    def test_1d_paperdata_compact(self):
+        for pos_dtype in (np.int32, np.uint32):
+            quant = gp.accumulators.QuantileEstimator(p=0.5, pos_dtype=pos_dtype)
+            for v, p, h in zip(paper_sample_values, paper_sample_m_pos, paper_sample_m_height):
+                quant.accumulate(v)
+                n, pos, height = quant._debug_info
+                self.assertEqual(pos.dtype, pos_dtype)
+                self.assertEqual(p, list(pos), f'Position test failed after value {n}: {v}.')
+                self.assertTrue(np.allclose(h, list(height), equal_nan=True))
+
+    def test_2d_compact(self):
+        np.random.seed(42)
+        data = np.random.normal(size=(500, 3, 4))
+        cdf = gp.accumulators.CDFEstimator(7)
+        cdf.accumulate_batch(data)
+        cdf2 = gp.accumulators.CDFEstimator(7, pos_dtype=np.uint32)
+        cdf2.accumulate_batch(data)
+        np.testing.assert_array_equal(cdf.m_pos, cdf2.m_pos)
+        np.testing.assert_array_equal(cdf.m_height, cdf2.m_height)
+        cdf3 = gp.accumulators.CDFEstimator(7, pos_dtype=np.int32, height_dtype=np.float32)
+        cdf3.accumulate_batch(data)
+        self.assertEqual(cdf3.m_height.dtype, np.float32)
+        self.assertEqual(cdf3.m_height.nbytes + cdf3.m_pos.nbytes, cdf.m_height.nbytes)
+        # rounding may change single steps, but the estimate is as good.
+        q = np.quantile(data, cdf.q_desired[1:-1], axis=0)
+        err = np.mean(np.abs(cdf.m_height[1:-1] - q))
+        err3 = np.mean(np.abs(cdf3.m_height[1:-1] - q))
+        self.assertLess(err3, 1.2 * err)
+
+
+class TestCDFMemory(unittest.TestCase):
+
+    def peak(self, cdf):
+        # the peak of temporary memory per observation once initialized
+        np.random.seed(42)
+        data = np.random.random((30, 64, 64))
+        cdf.accumulate_batch(data[:25])
+        tracemalloc.start()
+        try:
+            for d in data[25:]:
+                cdf.accumulate(d)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_temporaries(self):
+        # temporary arrays must be much smaller than the state
+        cdf = gp.accumulators.CDFEstimator(21)
+        self.assertLess(self.peak(cdf), (cdf.m_pos.nbytes + cdf.m_height.nbytes) / 4)
+
+    def test_compact(self):
+        # the compact state must not be offset by wider temporaries
+        cdf = gp.accumulators.CDFEstimator(21, pos_dtype=np.uint32, height_dtype=np.float32)
+        self.assertLess(self.peak(cdf), (cdf.m_pos.nbytes + cdf.m_height.nbytes) / 2)
+
+
 if __name__ == '__main__':
     unittest.main()